@@ -0,0 +1,330 @@
+import math
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+import numpy as np
+
+# local module
+import instrument
+
+SAMPLE_RATE = 44100
+
+# players for the pipe sink, both read raw mono s16le from stdin
+APLAY_COMMAND = ['aplay', '-q', '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', str(SAMPLE_RATE)]
+SOX_PLAY_COMMAND = ['play', '-q', '-t', 'raw', '-e', 'signed', '-b', '16', '-c', '1', '-r', str(SAMPLE_RATE), '-']
+# aplay on linux, sox's play on mac
+PLAYER_COMMAND = SOX_PLAY_COMMAND if sys.platform == 'darwin' else APLAY_COMMAND
+
+
+# tones the oscillator plays, as many as the shipped tones/pure/ has
+N_TONES = 100
+
+
+def tone_to_freq(tone):
+    # same mapping as the files in tones/pure/: NN.wav is (NN + 1) * 10 Hz
+    return (tone + 1) * 10.0
+
+
+def volume_to_gain(volume):
+    # the old mplayer command used -af volume=(volume / 100 - 1) * 20 dB,
+    # so 100 is unity gain. keep that curve.
+    return 10.0 ** (volume / 100.0 - 1.0)
+
+
+def to_pcm(samples):
+    # float samples in [-1, 1] -> int16
+    return np.clip(samples * 32767.0, -32768, 32767).astype(np.int16)
+
+
+class Oscillator:
+    # Sine oscillator that keeps its phase between blocks, so changing the
+    # frequency never produces a click. Frequency and gain changes are ramped
+    # linearly across the next block.
+
+    # seconds a new tone waits before it starts, see BankVoice.delay
+    delay = 0.0
+
+    def __init__(self, sample_rate=SAMPLE_RATE, freq=440.0, gain=0.0):
+        self.sample_rate = sample_rate
+        self.phase = 0.0
+        self.freq = self.target_freq = float(freq)
+        self.gain = self.target_gain = float(gain)
+        self._ramp = np.zeros(0)
+
+    def set_freq(self, freq):
+        self.target_freq = float(freq)
+
+    def set_tone(self, tone):
+        self.set_freq(tone_to_freq(tone))
+
+    def set_gain(self, gain):
+        self.target_gain = float(gain)
+
+    def render(self, n):
+        if len(self._ramp) != n:
+            self._ramp = np.arange(1, n + 1) / n
+
+        # read the targets once, they may be changed from another thread
+        freq1 = self.target_freq
+        gain1 = self.target_gain
+
+        freqs = self.freq + (freq1 - self.freq) * self._ramp
+        phase = self.phase + np.cumsum(freqs) * (2 * math.pi / self.sample_rate)
+        out = np.sin(phase)
+        out *= self.gain + (gain1 - self.gain) * self._ramp
+
+        self.phase = phase[-1] % (2 * math.pi)
+        self.freq = freq1
+        self.gain = gain1
+
+        return out
+
+
+class BankVoice:
+    # Loops tones straight out of a memory-mapped tonebank.ToneBank. `entries`
+    # maps theremin tone numbers to bank indices. A new tone only takes over
+    # at the end of the current loop, the tones fade in and out at their
+    # edges so that's where switching is click-free.
+    def __init__(self, bank, entries):
+        self.bank = bank
+        self.entries = entries
+        self.tone = self.target_tone = 0
+        self.pos = 0
+        self.gain = self.target_gain = 0.0
+        self._ramp = np.zeros(0)
+
+    def set_tone(self, tone):
+        self.target_tone = min(max(int(tone), 0), len(self.entries) - 1)
+
+    def set_gain(self, gain):
+        self.target_gain = float(gain)
+
+    @property
+    def delay(self):
+        # seconds of the current loop left to render, a new tone waits that long
+        tone = self.entries[self.tone]
+        return (len(self._samples()) - self.pos) / self.bank.rate(tone)
+
+    def _samples(self):
+        samples = self.bank.view(self.entries[self.tone])
+        # stereo tones: just play the left channel, still a view
+        return samples if samples.ndim == 1 else samples[:, 0]
+
+    def render(self, n):
+        if len(self._ramp) != n:
+            self._ramp = np.arange(1, n + 1) / n
+
+        out = np.empty(n)
+        filled = 0
+        samples = self._samples()
+        while filled < n:
+            take = min(n - filled, len(samples) - self.pos)
+            out[filled:filled + take] = samples[self.pos:self.pos + take]
+            filled += take
+            self.pos += take
+
+            if self.pos >= len(samples):
+                self.pos = 0
+                self.tone = self.target_tone
+                samples = self._samples()
+
+        gain1 = self.target_gain
+        out *= (self.gain + (gain1 - self.gain) * self._ramp) / 32768.0
+        self.gain = gain1
+
+        return out
+
+
+class NullSink:
+    # Throws the audio away, for when there's nothing to play it on.
+    def write(self, pcm):
+        pass
+
+    def close(self):
+        pass
+
+
+class BufferSink:
+    # Keeps everything in memory, mostly useful for tests.
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, pcm):
+        self.chunks.append(pcm.copy())
+
+    def getvalue(self):
+        if not self.chunks:
+            return np.zeros(0, np.int16)
+        return np.concatenate(self.chunks)
+
+    def close(self):
+        pass
+
+
+class WavSink:
+    def __init__(self, path, sample_rate=SAMPLE_RATE):
+        self.wav_file = wave.open(path, 'wb')
+        self.wav_file.setnchannels(1)
+        self.wav_file.setsampwidth(2)
+        self.wav_file.setframerate(sample_rate)
+
+    def write(self, pcm):
+        self.wav_file.writeframes(pcm.tobytes())
+
+    def close(self):
+        self.wav_file.close()
+
+
+class TeeSink:
+    # Hands every block to several sinks, e.g. the speaker and a recording.
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, pcm):
+        for sink in self.sinks:
+            sink.write(pcm)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class PipeSink:
+    # Writes raw mono s16le PCM either to a player process (PLAYER_COMMAND
+    # by default) or to an already open binary stream, e.g.
+    # sys.stdout.buffer.
+    def __init__(self, command=None, stream=None):
+        self.process = None
+        if stream is None:
+            self.process = subprocess.Popen(command or PLAYER_COMMAND,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL)
+            stream = self.process.stdin
+        self.stream = stream
+
+    def write(self, pcm):
+        try:
+            self.stream.write(pcm.tobytes())
+        except BrokenPipeError:
+            # player went away, nothing sensible to do but keep going silently
+            pass
+
+    def close(self):
+        if self.process:
+            try:
+                self.stream.close()
+            except BrokenPipeError:
+                pass
+            self.process.wait()
+        else:
+            self.stream.flush()
+
+
+def default_sink():
+    # the platform's player, or silence if it isn't installed
+    try:
+        return PipeSink()
+    except OSError as e:
+        print("Couldn't start {} ({}), the theremin will be silent.".format(PLAYER_COMMAND[0], e))
+        return NullSink()
+
+
+class AudioEngine:
+    # Long-lived audio engine. A single thread renders the voice (an
+    # Oscillator unless told otherwise) in small blocks and pushes them to
+    # the sink, staying `lead` blocks ahead of the wall clock so latency
+    # stays low.
+    def __init__(self, sink=None, voice=None, sample_rate=SAMPLE_RATE, block_size=512, lead=2):
+        self.sink = sink if sink is not None else default_sink()
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.lead = lead
+        self.voice = voice if voice is not None else Oscillator(sample_rate, freq=tone_to_freq(0))
+        self.volume = 100
+        self.muted = True
+        self.frames_written = 0
+
+        self._thread = None
+        self._running = False
+
+    def set_tone(self, tone):
+        self.voice.set_tone(tone)
+
+    def set_volume(self, volume):
+        self.volume = volume
+        if not self.muted:
+            self.voice.set_gain(volume_to_gain(volume))
+
+    def mute(self):
+        self.muted = True
+        self.voice.set_gain(0.0)
+
+    def unmute(self):
+        self.muted = False
+        self.voice.set_gain(volume_to_gain(self.volume))
+
+    @property
+    def is_running(self):
+        return self._running
+
+    @property
+    def latency(self):
+        # roughly how far ahead of the speaker the engine renders, in seconds
+        return self.lead * self.block_size / self.sample_rate
+
+    def render(self, n_frames):
+        # Synchronously render n_frames into the sink, without pacing.
+        while n_frames > 0:
+            n = min(n_frames, self.block_size)
+            self._write_block(n)
+            n_frames -= n
+
+    def start(self):
+        if self._running:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='audio-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+
+        self._running = False
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        self.sink.close()
+
+    @instrument.timed('audio.block')
+    def _write_block(self, n):
+        self.sink.write(to_pcm(self.voice.render(n)))
+        self.frames_written += n
+
+    def _run(self):
+        lead_time = self.latency
+        start = time.monotonic()
+        frames = 0
+
+        while self._running:
+            self._write_block(self.block_size)
+            frames += self.block_size
+
+            ahead = frames / self.sample_rate - (time.monotonic() - start)
+            if ahead > lead_time:
+                time.sleep(ahead - lead_time)
+            elif ahead < 0:
+                # we fell behind (the sink stalled), don't try to catch up
+                # with a burst, just restart the clock from here.
+                start = time.monotonic() - frames / self.sample_rate
+
+        # fade out instead of cutting the wave mid-cycle
+        self.voice.set_gain(0.0)
+        self._write_block(self.block_size)
@@ -1,9 +1,76 @@
+import functools
+
 import numpy as np
 import cv2
 
+# local modules
+import capture
+import instrument
+from frame_context import FrameContext
+
+
+# HSV range that counts as green screen
+GREEN_LOWER = (50., 10., 0.)
+GREEN_UPPER = (200., 255., 170.)
+
+
+class LutKeyer:
+    # Green screen keying without the per-frame HSV conversion. The HSV
+    # thresholds are baked into a quantized BGR -> key table (bins^3 entries)
+    # once, and each frame is classified with a single table lookup pass,
+    # which is what calcBackProject does for a 3D histogram.
+    def __init__(self, lower, upper, bins=32):
+        self.bins = bins
+        self.lower = None
+        self.upper = None
+        self.table = None
+        self._mask = None
+        self.set_thresholds(lower, upper)
+
+    def set_thresholds(self, lower, upper):
+        # only rebuilds the table when the thresholds actually changed
+        if self.table is not None and np.array_equal(lower, self.lower) and np.array_equal(upper, self.upper):
+            return
+
+        self.lower = np.array(lower, np.float64)
+        self.upper = np.array(upper, np.float64)
+
+        # classify the centre colour of every bin
+        centers = ((np.arange(self.bins) + 0.5) * 256 / self.bins).astype(np.uint8)
+        b, g, r = np.meshgrid(centers, centers, centers, indexing='ij')
+        colors = np.dstack((b.reshape(-1, 1), g.reshape(-1, 1), r.reshape(-1, 1)))
+        hsv = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+        green = cv2.inRange(hsv, self.lower, self.upper)
+
+        self.table = green.reshape(self.bins, self.bins, self.bins).astype(np.float32)
+        if hasattr(cv2, 'Mat'):
+            # otherwise the bindings read a 3D array as a 2D image with
+            # `bins` channels instead of a 3D histogram
+            self._hist = cv2.Mat(self.table, wrap_channels=False)
+        else:
+            self._hist = None
+
+    @instrument.timed('key')
+    def getGreenMask(self, frame, dst=None):
+        # Without dst the mask goes into a buffer reused by the next call,
+        # callers on several threads must each pass their own.
+        if dst is None:
+            if self._mask is None or self._mask.shape != frame.shape[:2]:
+                self._mask = np.empty(frame.shape[:2], np.uint8)
+            dst = self._mask
+
+        if self._hist is not None:
+            cv2.calcBackProject([frame], [0, 1, 2], self._hist, [0, 256, 0, 256, 0, 256], 1, dst=dst)
+        else:
+            # older opencv without cv2.Mat, do the lookup in numpy (allocates)
+            q = frame // (256 // self.bins)
+            dst[:] = self.table[q[..., 0], q[..., 1], q[..., 2]]
+
+        return dst
+
 
 class BackSub:
-    def __init__(self, firstFrame):
+    def __init__(self, firstFrame, keying='hsv', lut_bins=32):
         # by default, uses only the first 200 frames
         # to compute a background
         self.avg_frames = 1
@@ -11,22 +78,121 @@ class BackSub:
         self.backGroundModel = firstFrame
         self.counter = 0
 
+        # HSV range that counts as green screen
+        self.lower = np.array(GREEN_LOWER)
+        self.upper = np.array(GREEN_UPPER)
+
+        # per-frame scratch buffers, allocated once on the first frame
+        self._hsv = None
+        self._green = None
+
+        # keying='lut' classifies through a LutKeyer instead of HSV
+        self.lut_keyer = None
+        if keying == 'lut':
+            self.lut_keyer = LutKeyer(self.lower, self.upper, lut_bins)
+
     def getForeground(self, frame):
         hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        green = cv2.inRange(hsv, np.array((50., 10., 0.)), np.array((200., 255, 170.0)))
+        green = cv2.inRange(hsv, self.lower, self.upper)
         not_green = cv2.bitwise_not(green)
         not_green = cv2.cvtColor(not_green, cv2.COLOR_GRAY2BGR)
 
         return not_green
 
+    def getGreenMask(self, frame):
+        # single channel mask, 255 where the green screen is. The returned
+        # array is reused by the next call.
+        #
+        # frame can also be a FrameContext, then the denoised frame is keyed
+        # into a mask that belongs to the context (so frames on different
+        # threads don't share a buffer) and is cached there.
+        if isinstance(frame, FrameContext):
+            ctx = frame
+            if self.lut_keyer is not None:
+                self.lut_keyer.set_thresholds(self.lower, self.upper)
+                return ctx.cached(('lut_key', id(self)), lambda: self.lut_keyer.getGreenMask(
+                    ctx.denoised, np.empty(ctx.denoised.shape[:2], np.uint8)))
+            return ctx.mask(self.lower, self.upper, denoised=True)
 
-def denoise(frame):
-    frame = cv2.medianBlur(frame, 5)
-    frame = cv2.GaussianBlur(frame, (5, 5), 0)
+        if self.lut_keyer is not None:
+            # picks up any change to self.lower/self.upper
+            self.lut_keyer.set_thresholds(self.lower, self.upper)
+            return self.lut_keyer.getGreenMask(frame)
+
+        if self._hsv is None or self._hsv.shape != frame.shape:
+            self._hsv = np.empty_like(frame)
+            self._green = np.empty(frame.shape[:2], np.uint8)
+
+        with instrument.span('key'):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=self._hsv)
+            cv2.inRange(self._hsv, self.lower, self.upper, dst=self._green)
+
+        return self._green
+
+    def upsampleMask(self, green, frame):
+        # Scales a low resolution green mask up to the size of frame. Only
+        # the pixels along the edge, where the interpolated mask is neither
+        # fully green nor fully not green, get keyed again at full
+        # resolution, so the edges stay sharp for the price of a thin band.
+        h, w = frame.shape[:2]
+        up = cv2.resize(green, (w, h), interpolation=cv2.INTER_LINEAR)
+
+        ys, xs = np.nonzero((up > 0) & (up < 255))
+        if len(ys):
+            edge = frame[ys, xs].reshape(-1, 1, 3)
+            hsv = cv2.cvtColor(edge, cv2.COLOR_BGR2HSV)
+            up[ys, xs] = cv2.inRange(hsv, self.lower, self.upper).reshape(-1)
+
+        return up
+
+    @instrument.timed('composite')
+    def composite(self, frame, background, out=None):
+        # Puts background wherever frame is green, writing into out (which
+        # must be the same shape as frame). With out=None the frame itself
+        # is overwritten. Nothing is allocated per frame.
+        #
+        # With a FrameContext, its denoised frame is composited. If the
+        # context works at a reduced scale, the mask is keyed at that scale
+        # and upsampled, and the full resolution raw frame is composited.
+        green = self.getGreenMask(frame)
+        if isinstance(frame, FrameContext):
+            ctx = frame
+            if ctx.scale != 1.0:
+                frame = ctx.frame
+                green = self.upsampleMask(green, frame)
+            else:
+                frame = ctx.denoised
+
+        if out is None:
+            out = frame
+        elif out is not frame:
+            np.copyto(out, frame)
+        cv2.copyTo(background, green, out)
+
+        return out
+
+
+@instrument.timed('denoise')
+def denoise(frame, median=5, gauss=5):
+    # kernel sizes, 0 skips that filter
+    if median:
+        frame = cv2.medianBlur(frame, median)
+    if gauss:
+        frame = cv2.GaussianBlur(frame, (gauss, gauss), 0)
 
     return frame
 
 
+def denoiser(median=5, gauss=5):
+    # denoise with other kernel sizes, for FrameContext. None when both
+    # filters are off, the context then uses the raw frame.
+    if not median and not gauss:
+        return None
+    if (median, gauss) == (5, 5):
+        return denoise
+    return functools.partial(denoise, median=median, gauss=gauss)
+
+
 if __name__ == "__main__":
     # Just a simple function to perform
     # some filtering before any further processing.
@@ -42,7 +208,7 @@ if __name__ == "__main__":
                 print('down!')
                 thresh -= 1
 
-    cam = cv2.VideoCapture(0)
+    cam = capture.ThreadedCapture(cv2.VideoCapture(0))
     ret, frame = cam.read()
     cam_height, cam_width, _channels = frame.shape
 
@@ -56,8 +222,14 @@ if __name__ == "__main__":
     img = cv2.imread('backgrounds/paris-1-.png')
     img = cv2.resize(img, (cam_width, cam_height))
 
-    cv2.namedWindow('mask')
-    cv2.setMouseCallback('mask', onmouse)
+    # composited output, reused every frame
+    final = np.empty_like(frame)
+
+    # local module
+    import display
+
+    disp = display.default_display()
+    disp.open('mask')
 
     thresh = 45
 
@@ -69,24 +241,19 @@ if __name__ == "__main__":
         if ret is True:
             # Show the filtered image
 
-            # get the foreground
-            fgmask = backSubtractor.getForeground(denoise(frame))
-            # foreGround = cv2.cvtColor(foreGround, cv2.COLOR_BGR2GRAY)
-            frame &= fgmask
-
-            mask_inv = cv2.bitwise_not(fgmask)
-            masked_img = img & mask_inv
-
-            final = cv2.add(frame, masked_img)
+            # swap the green for the background image
+            backSubtractor.composite(denoise(frame), img, final)
 
             # Apply thresholding on the background and display the resulting mask
 
             # Note: The mask is displayed as a RGB image, you can
             # display a grayscale image by converting 'foreGround' to
             # a grayscale before applying the threshold.
-            cv2.imshow('mask', final)
+            disp.show('mask', final)
 
-            key = cv2.waitKey(10) & 0xFF
+            for event, x, y, flags in disp.mouse_events('mask'):
+                onmouse(event, x, y, flags, None)
+            key = disp.key() & 0xFF
         else:
             break
 
@@ -94,4 +261,4 @@ if __name__ == "__main__":
             break
 
     cam.release()
-    cv2.destroyAllWindows()
+    disp.shutdown()
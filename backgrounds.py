@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+DEFAULT_NAMES = ('space.png', 'paris-1-.png', 'alley.png', 'lab.png', 'sharks.png')
+
+
+class BackgroundManager:
+    # Cycles through background images, decoding each one lazily and keeping
+    # it already resized to the pipeline resolution. The cache is LRU with a
+    # memory cap, and the next background in the cycle is always preloaded
+    # on a worker thread so switching scenes doesn't stall a frame.
+    def __init__(self, size, names=DEFAULT_NAMES, directory='backgrounds', max_bytes=64 * 1024 * 1024):
+        # size is (width, height), same as cv2.resize
+        self.size = tuple(size)
+        self.paths = [os.path.join(directory, name) for name in names]
+        self.max_bytes = max_bytes
+        self.index = 0
+
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='background-loader')
+
+        self.preload(self.index)
+        self.preload(self._next_index())
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _next_index(self):
+        return (self.index + 1) % len(self.paths)
+
+    def _load(self, idx):
+        img = cv2.imread(self.paths[idx])
+        assert img is not None, "Unable to read background {}".format(self.paths[idx])
+        img = cv2.resize(img, self.size)
+
+        with self._lock:
+            self._pending.pop(idx, None)
+            self._insert(idx, img)
+
+        return img
+
+    def _insert(self, idx, img):
+        if idx in self._cache:
+            return
+
+        self._cache[idx] = img
+        self._cache_bytes += img.nbytes
+
+        # Evict least recently used first, but never the one being shown or
+        # the one preloaded to be shown next, even if those two alone go
+        # over max_bytes.
+        keep = (self.index, self._next_index())
+        for old_idx in list(self._cache):
+            if self._cache_bytes <= self.max_bytes:
+                break
+            if old_idx not in keep:
+                self._cache_bytes -= self._cache.pop(old_idx).nbytes
+
+    def preload(self, idx):
+        with self._lock:
+            if idx in self._cache or idx in self._pending:
+                return
+            self._pending[idx] = self._pool.submit(self._load, idx)
+
+    def get(self, idx):
+        with self._lock:
+            img = self._cache.get(idx)
+            if img is not None:
+                self._cache.move_to_end(idx)
+                return img
+            future = self._pending.get(idx)
+
+        if future is not None:
+            return future.result()
+        return self._load(idx)
+
+    def current(self):
+        return self.get(self.index)
+
+    def advance(self):
+        # switch to the next background and start loading the one after it
+        self.index = self._next_index()
+        self.preload(self._next_index())
+
+        return self.index
+
+    def close(self):
+        self._pool.shutdown(wait=False)
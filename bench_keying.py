@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+'''
+Compares the HSV keying path of BackSub against the lookup-table path
+(LutKeyer) for speed and accuracy.
+
+Usage:
+    bench_keying.py [--size WxH] [--frames N]
+
+Accuracy is measured against the HSV path, which is the reference, on the
+images in backgrounds/ plus a synthetic green screen with a white coat on it.
+'''
+
+import time
+
+import numpy as np
+import cv2
+
+# local module
+import background_subtraction as bsub
+from backgrounds import DEFAULT_NAMES
+
+
+def synthetic_green_screen(size):
+    # uneven green with some shading and noise, and a white-ish blob in the middle
+    w, h = size
+    shade = np.linspace(0.6, 1.0, w, dtype=np.float32)[np.newaxis, :] * np.linspace(0.7, 1.0, h, dtype=np.float32)[:, np.newaxis]
+    img = np.zeros((h, w, 3), np.float32)
+    img[..., 0] = 40 * shade
+    img[..., 1] = 170 * shade
+    img[..., 2] = 50 * shade
+    cv2.ellipse(img, ((w // 2, h // 2), (w // 5, h // 2), 0), (230, 235, 240), -1)
+    img += np.random.normal(0, 8, img.shape).astype(np.float32)
+
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def time_per_frame(fn, frame, n):
+    fn(frame)
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(frame)
+    return (time.perf_counter() - start) / n * 1000
+
+
+if __name__ == '__main__':
+    import sys
+    import getopt
+
+    args, _ = getopt.getopt(sys.argv[1:], '', ['size=', 'frames='])
+    args = dict(args)
+    size = tuple(map(int, args.get('--size', '1920x1080').split('x')))
+    n = int(args.get('--frames', 50))
+
+    images = [('green screen', synthetic_green_screen(size))]
+    for name in DEFAULT_NAMES:
+        img = cv2.imread('backgrounds/{}'.format(name))
+        if img is not None:
+            images.append((name, cv2.resize(img, size)))
+
+    reference = bsub.BackSub(images[0][1])
+    hsv_ms = time_per_frame(reference.getGreenMask, images[0][1], n)
+    print('hsv        {:7.2f} ms/frame'.format(hsv_ms))
+
+    for bins in (16, 32, 64):
+        start = time.perf_counter()
+        keyed = bsub.BackSub(images[0][1], keying='lut', lut_bins=bins)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        lut_ms = time_per_frame(keyed.getGreenMask, images[0][1], n)
+        print('lut {:2d}^3   {:7.2f} ms/frame  ({:.2f}x, table built in {:.1f} ms)'.format(
+            bins, lut_ms, hsv_ms / lut_ms, build_ms))
+
+        for name, img in images:
+            expected = reference.getGreenMask(img) > 0
+            got = keyed.getGreenMask(img) > 0
+            total = expected.size
+            print('    {:14s} agree {:6.2f}%  false green {:5.2f}%  missed green {:5.2f}%'.format(
+                name,
+                100.0 * np.count_nonzero(expected == got) / total,
+                100.0 * np.count_nonzero(got & ~expected) / total,
+                100.0 * np.count_nonzero(expected & ~got) / total))
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+
+'''
+Runs the processing of each of the runnable programs headless, without a
+camera, window or anyone pressing "s", and reports the timings as JSON.
+
+Usage:
+    bench_pipelines.py [--source SRC] [--frames N] [--warmup N]
+                       [--select x,y,w,h] [--out report.json] [pipeline ...]
+
+pipeline is any of backsub, camshift, camshift_drawing, theremin and
+theremin_and_backsub (default: all of them). SRC is anything
+video.create_capture takes, a video file or a synth: source, by default
+the synthetic green screen. --select is the tracker selection, by default
+the first blob of a green screen source or the middle of the frame.
+
+For every pipeline the report has the fps, the frame latency percentiles
+(p50/p95/p99, from reading the frame to the finished output) and the time
+spent in each stage. The first --warmup frames aren't counted.
+'''
+
+import json
+import time
+
+import numpy as np
+import cv2 as cv
+
+# local modules
+import audio
+import background_subtraction as bsub
+import common
+import pipeline
+import tracker
+import video
+from frame_context import FrameContext
+
+DEFAULT_SOURCE = video.presets['greenscreen']
+PIPELINES = ('backsub', 'camshift', 'camshift_drawing', 'theremin', 'theremin_and_backsub')
+
+
+class Recorder:
+    # per-stage and per-frame samples, in seconds
+    def __init__(self, warmup):
+        self.warmup = warmup
+        self.stages = {}
+        self.latencies = []
+
+    def stage(self, name, fn):
+        # fn wrapped so every call is timed, safe to call from several threads
+        samples = self.stages.setdefault(name, [])
+
+        def timed(*args):
+            start = time.perf_counter()
+            result = fn(*args)
+            samples.append(time.perf_counter() - start)
+            return result
+        return timed
+
+    def frame_done(self, latency):
+        self.latencies.append(latency)
+
+    def report(self, wall):
+        def summary(samples):
+            ms = np.array(samples[self.warmup:] or [0.0]) * 1000
+            return dict(mean_ms=float(ms.mean()),
+                        p50_ms=float(np.percentile(ms, 50)),
+                        p95_ms=float(np.percentile(ms, 95)),
+                        p99_ms=float(np.percentile(ms, 99)))
+
+        counted = max(len(self.latencies) - self.warmup, 0)
+        return dict(frames=counted,
+                    fps=counted / wall if wall > 0 else 0.0,
+                    latency=summary(self.latencies),
+                    stages={name: summary(samples) for name, samples in self.stages.items()})
+
+
+def default_selection(frame, cap):
+    # the first blob of a green screen source, otherwise the middle
+    h, w = frame.shape[:2]
+    if hasattr(cap, 'positions_at'):
+        (cx, cy), (bw, bh) = cap.positions_at(0)[0], cap.blob_size
+        # frames get flipped when read, see tracker.read_frame_from_camera
+        return (int(w - cx - bw / 2), int(cy - bh / 2), int(bw), int(bh))
+    return (w // 3, h // 3, w // 3, h // 3)
+
+
+def backsub_stages(cap, first, selection):
+    bs = bsub.BackSub(bsub.denoise(first))
+    img = cv.imread('backgrounds/paris-1-.png')
+    img = np.zeros_like(first) if img is None else cv.resize(img, first.shape[1::-1])
+    final = np.empty_like(first)
+
+    def read(f):
+        f.frame = cap.read()[1]
+        return f
+
+    def denoise(f):
+        f.frame = bsub.denoise(f.frame)
+        return f
+
+    def composite(f):
+        f.final = bs.composite(f.frame, img, final)
+        return f
+
+    return [('read', read), ('denoise', denoise), ('composite', composite)], None
+
+
+def camshift_stages(cap, first, selection, predict=False):
+    ct = tracker.create_tracker('camshift', camera=cap, predict=predict)
+    ct.frame = first
+    ct.add_target(selection)
+
+    def read(f):
+        f.t = time.monotonic()
+        f.frame = tracker.read_frame_from_camera(cap)
+        return f
+
+    def track(f):
+        ct.update(FrameContext(f.frame), f.t)
+        f.track_box = ct.track_box
+        return f
+
+    def draw(f):
+        if f.track_box:
+            cv.ellipse(f.frame, f.track_box, (0, 0, 255), 2)
+        return f
+
+    return [('read', read), ('track', track), ('draw', draw)], ct
+
+
+def camshift_drawing_stages(cap, first, selection):
+    import camshift_drawing
+
+    app = camshift_drawing.App(camera=cap, window=None)
+    x, y, w, h = selection
+    app.user_selection_box = (x, y, x + w, y + h)
+    app.track_window = selection
+    app.selection_completed = True
+    app.paint_active = True
+
+    def read(f):
+        f.frame = camshift_drawing.read_frame_from_camera(cap)
+        return f
+
+    def process(f):
+        f.final = app.process(f.frame)
+        return f
+
+    return [('read', read), ('process', process)], None
+
+
+def theremin_stages(cap, first, selection):
+    import theremin
+
+    stages, ct = camshift_stages(cap, first, selection, predict=True)
+    tm = theremin.Theremin(sink=audio.BufferSink())
+    height, width = first.shape[:2]
+
+    def control(f):
+        x, _ = ct.predicted_point(f.t + tm.tone_latency)
+        _, y = ct.predicted_point(f.t + tm.volume_latency)
+        x = min(max(x, 0), width - 1)
+        y = min(max(y, 0), height - 1)
+        tm.set_tone(tm.tone_at(x / width))
+        tm.set_volume(int((1 - (y / height)) ** 2 * 100))
+        return f
+
+    return stages + [('control', control)], tm
+
+
+def theremin_and_backsub_pipeline(cap, first, selection, rec):
+    # the same stages as theremin_and_backsub, on the same threads
+    import backgrounds
+
+    ct = tracker.create_tracker('camshift', camera=cap, predict=True)
+    ct.frame = first
+    ct.add_target(selection)
+    bs = bsub.BackSub(first)
+    height, width = first.shape[:2]
+    bgs = backgrounds.BackgroundManager((width, height))
+
+    def read():
+        frame = tracker.read_frame_from_camera(cap)
+        return common.Bunch(ctx=FrameContext(frame, bsub.denoise), t=time.monotonic(), start=time.perf_counter())
+
+    def track(f):
+        ct.update(f.ctx, f.t)
+        f.track_boxes = ct.track_boxes
+        return f
+
+    def denoise(f):
+        bs.getGreenMask(f.ctx)
+        return f
+
+    def composite(f):
+        f.final = bs.composite(f.ctx, bgs.current())
+        for tb in f.track_boxes:
+            if tb and tb[1][0] > 0 and tb[1][1] > 0:
+                cv.ellipse(f.final, tb, (255, 255, 255), 2)
+        return f
+
+    frames = pipeline.Pipeline([
+        pipeline.Stage('track', rec.stage('track', track)),
+        pipeline.Stage('denoise', rec.stage('denoise', denoise), workers=2),
+        pipeline.Stage('composite', rec.stage('composite', composite)),
+    ], source=rec.stage('read', read))
+
+    return frames, bgs
+
+
+# Both runners return the wall time of the frames after the warmup, from
+# the last warmup frame coming out to the last frame coming out.
+def run_sequential(stages, frames, warmup, rec):
+    stages = [rec.stage(name, fn) for name, fn in stages]
+
+    start = time.perf_counter()
+    for i in range(frames + warmup):
+        if i == warmup:
+            start = time.perf_counter()
+        f = common.Bunch()
+        frame_start = time.perf_counter()
+        for stage in stages:
+            stage(f)
+        rec.frame_done(time.perf_counter() - frame_start)
+
+    return time.perf_counter() - start
+
+
+def run_pipelined(frames_pipeline, frames, warmup, rec):
+    # the source thread stops by itself after all frames are read
+    source = frames_pipeline.source
+    left = [frames + warmup]
+
+    def limited():
+        if left[0] == 0:
+            return None
+        left[0] -= 1
+        return source()
+    frames_pipeline.source = limited
+
+    start = time.perf_counter()
+    frames_pipeline.start()
+    while True:
+        seq, f = frames_pipeline.get()
+        if f is None:
+            break
+        now = time.perf_counter()
+        rec.frame_done(now - f.start)
+        if seq == warmup - 1:
+            start = now
+
+    return time.perf_counter() - start
+
+
+def run(name, source, frames, warmup, selection=None):
+    cap = video.create_capture(source, None)
+    if cap is None:
+        raise IOError('unable to open video source {}'.format(source))
+    first = tracker.read_frame_from_camera(cap)
+    selection = selection or default_selection(first, cap)
+    rec = Recorder(warmup)
+
+    if name == 'theremin_and_backsub':
+        frames_pipeline, bgs = theremin_and_backsub_pipeline(cap, first, selection, rec)
+        wall = run_pipelined(frames_pipeline, frames, warmup, rec)
+        bgs.close()
+    else:
+        make = dict(backsub=backsub_stages, camshift=camshift_stages,
+                    camshift_drawing=camshift_drawing_stages, theremin=theremin_stages)[name]
+        stages, owner = make(cap, first, selection)
+        wall = run_sequential(stages, frames, warmup, rec)
+        if hasattr(owner, 'close'):
+            owner.close()
+
+    if hasattr(cap, 'release'):
+        cap.release()
+
+    return rec.report(wall)
+
+
+if __name__ == '__main__':
+    import sys
+    import getopt
+
+    args, names = getopt.getopt(sys.argv[1:], '', ['source=', 'frames=', 'warmup=', 'select=', 'out='])
+    args = dict(args)
+    source = args.get('--source', DEFAULT_SOURCE)
+    frames = int(args.get('--frames', 300))
+    warmup = int(args.get('--warmup', 10))
+    selection = tuple(map(int, args['--select'].split(','))) if '--select' in args else None
+
+    for name in names:
+        if name not in PIPELINES:
+            sys.exit('unknown pipeline {!r}, use one of {}'.format(name, ', '.join(PIPELINES)))
+
+    report = dict(source=source, frames=frames, pipelines={})
+    for name in names or PIPELINES:
+        report['pipelines'][name] = run(name, source, frames, warmup, selection)
+
+    output = json.dumps(report, indent=2)
+    if '--out' in args:
+        with open(args['--out'], 'w') as out_file:
+            out_file.write(output + '\n')
+    else:
+        print(output)
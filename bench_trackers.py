@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+'''
+Compares the trackers (CamShift and the green screen blob tracker) on a
+synthetic green screen with a coat moving over it (video.GreenScreen).
+
+Usage:
+    bench_trackers.py [--source SRC] [--frames N] [--scale S]
+
+SRC is a synth:class=greenscreen source (default DEFAULT_SOURCE), the first
+blob in it is the one tracked.
+
+For each tracker prints the time per update, the mean distance of the
+tracked point from the true centre of the coat, and the jitter (mean frame
+to frame change of that error, i.e. how much the point wobbles on top of
+the real movement). The green screen mask is computed before the clock
+starts, like in theremin_and_backsub where the keyer pays for it anyway.
+
+CamShift follows hue, which a plain white coat on green doesn't have much
+of; add :color=60,70,200 to the source to compare them on a coloured coat.
+'''
+
+import time
+
+import numpy as np
+
+# local modules
+import background_subtraction as bsub
+import tracker
+import video
+from frame_context import FrameContext
+
+DEFAULT_SOURCE = 'synth:class=greenscreen:noise=0.02:size=1280x720'
+
+
+def initial_window(cap, i=0):
+    # the box around blob i where it starts
+    (cx, cy), (w, h) = cap.positions_at(0)[i], cap.blob_size
+    return (int(cx - w / 2), int(cy - h / 2), int(w), int(h))
+
+
+def run(kind, source, frames, scale):
+    camera = video.create_capture(source, None)
+    ct = tracker.create_tracker(kind, camera=camera)
+    ct.frame = camera.read()[1]
+    ct.add_target(initial_window(camera))
+
+    # frames are made up front, only the tracker is timed
+    shots = []
+    for _ in range(frames):
+        frame = camera.read()[1]
+        shots.append((frame, camera.positions[0]))
+
+    elapsed = 0.0
+    errors = []
+    for i, (frame, truth) in enumerate(shots):
+        ctx = FrameContext(frame, bsub.denoise, scale)
+        # in theremin_and_backsub the keyer needs this mask anyway
+        ctx.mask(bsub.GREEN_LOWER, bsub.GREEN_UPPER, denoised=True)
+        start = time.perf_counter()
+        ct.update(ctx, i / 30.0)
+        elapsed += time.perf_counter() - start
+
+        x, y = ct.point
+        errors.append((x - truth[0], y - truth[1]))
+
+    errors = np.array(errors)
+    distance = np.hypot(errors[:, 0], errors[:, 1])
+    jitter = np.hypot(*np.diff(errors, axis=0).T)
+
+    return elapsed / frames * 1000, distance.mean(), jitter.mean()
+
+
+if __name__ == '__main__':
+    import sys
+    import getopt
+
+    args, _ = getopt.getopt(sys.argv[1:], '', ['source=', 'frames=', 'scale='])
+    args = dict(args)
+    source = args.get('--source', DEFAULT_SOURCE)
+    frames = int(args.get('--frames', 200))
+    scale = float(args.get('--scale', 1.0))
+
+    for kind in ('camshift', 'blob'):
+        ms, error, jitter = run(kind, source, frames, scale)
+        print('{:9s} {:7.2f} ms/update  error {:6.1f} px  jitter {:5.2f} px'.format(kind, ms, error, jitter))
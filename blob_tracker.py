@@ -0,0 +1,123 @@
+import json
+import time
+
+import numpy as np
+import cv2 as cv
+
+# local modules
+from background_subtraction import GREEN_LOWER, GREEN_UPPER
+from frame_context import FrameContext
+from predictor import KalmanPredictor
+from tracker import Tracker
+import instrument
+
+
+class Blob:
+    # one tracked object, same attributes the Tracker interface expects
+    def __init__(self, track_window, predictor=None):
+        self.track_window = track_window
+        self.initial_window = track_window
+        self.predictor = predictor
+
+        # until a component is found, the middle of the selection
+        x, y, w, h = track_window
+        self.point = (int(x + w / 2), int(y + h / 2))
+        self.track_box = ((x + w / 2, y + h / 2), (w, h), 0.0)
+        self.confidence = 0.0
+
+
+class BlobTracker(Tracker):
+    # Tracks whatever isn't green screen. The green mask (the same one
+    # BackSub keys with, so with a shared FrameContext it's free) is shrunk
+    # further and split into connected components. Each target follows the
+    # nearest big enough component, no histograms and no iterations.
+    def __init__(self, predict=False, camera=None):
+        super().__init__(camera)
+        self.predict = predict
+
+        self.lower = GREEN_LOWER
+        self.upper = GREEN_UPPER
+
+        # extra downscale of the mask before labelling, on top of the
+        # FrameContext's processing scale
+        self.blob_scale = 0.25
+        # components smaller than this fraction of the frame are noise
+        self.min_area = 0.002
+
+    def add_target(self, track_window):
+        target = Blob(track_window, KalmanPredictor() if self.predict else None)
+        self.targets.append(target)
+
+        return target
+
+    def save_model(self, path):
+        model = dict(
+            tracker='blob',
+            lower=list(self.lower),
+            upper=list(self.upper),
+            blob_scale=self.blob_scale,
+            min_area=self.min_area,
+            targets=[dict(window=[int(v) for v in target.initial_window]) for target in self.targets])
+
+        with open(path, 'w') as model_file:
+            json.dump(model, model_file)
+
+    def load_model(self, path):
+        with open(path) as model_file:
+            model = json.load(model_file)
+
+        self.lower = tuple(model['lower'])
+        self.upper = tuple(model['upper'])
+        self.blob_scale = model['blob_scale']
+        self.min_area = model['min_area']
+
+        self.targets = []
+        for target in model['targets']:
+            self.add_target(tuple(target['window']))
+        self.selection_completed = True
+
+    def _expected(self, target, t):
+        # where to look for the target in this frame
+        if target.predictor is not None and target.predictor.ready:
+            return target.predictor.predict(t)
+        return target.point
+
+    @instrument.timed('track')
+    def update(self, ctx=None, timestamp=None):
+        # same contract as CamshiftTracker.update
+        if ctx is None:
+            ctx = FrameContext(self.frame)
+        else:
+            self.frame = ctx.frame
+        t = time.monotonic() if timestamp is None else timestamp
+
+        green = ctx.mask(self.lower, self.upper, denoised=True)
+        small = cv.resize(green, None, fx=self.blob_scale, fy=self.blob_scale, interpolation=cv.INTER_NEAREST)
+        cv.bitwise_not(small, small)
+
+        n, _labels, stats, centroids = cv.connectedComponentsWithStats(small, connectivity=8)
+
+        # back to full frame coordinates
+        f = 1.0 / (ctx.scale * self.blob_scale)
+        min_area = self.min_area * small.size
+        candidates = [i for i in range(1, n) if stats[i, cv.CC_STAT_AREA] >= min_area]
+
+        for target in self.targets:
+            if not candidates:
+                target.confidence = 0.0
+                continue
+
+            ex, ey = self._expected(target, t)
+            dists = [np.hypot(centroids[i][0] * f - ex, centroids[i][1] * f - ey) for i in candidates]
+            best = candidates.pop(int(np.argmin(dists)))
+
+            x, y, w, h, area = stats[best]
+            cx, cy = centroids[best] * f
+            target.track_window = (int(x * f), int(y * f), int(w * f), int(h * f))
+            target.track_box = ((cx, cy), (w * f, h * f), 0.0)
+            target.point = (int(cx), int(cy))
+            # how solid the blob is
+            target.confidence = area / float(w * h)
+
+            if target.predictor is not None:
+                target.predictor.correct((cx, cy), t)
@@ -1,124 +1,276 @@
 import cv2 as cv
 import numpy as np
+import json
 import sys
-
-# local module
-import video
-from video import presets
-
-
-class CamshiftTracker:
-    def __init__(self):
-        self.camera = get_new_video_source()
-
-        self.point = None
-
-        # Selection stuff
-        # idk how this works
-        self.user_selection_box = None
-        self.drag_start = None
-        self.track_window = None
-        self.selection_completed = False
-
-    def get_last_frame(self):
-        return self.frame
-
-    def ask_for_selection(self):
-        cv.namedWindow("selection picker")
-        cv.setMouseCallback("selection picker", self.selector)
-
-        while not self.selection_completed:
-            self.read_frame()
-            cv.imshow("selection picker", self.frame)
-
-            ch = cv.waitKey(5)
-            if ch == 27:
-                # if the user presses escape,
-                # abort the selection process.
-                break
-
-        cv.destroyWindow("selection picker")
-
-    def selector(self, event, x, y, flags, param):
-        if not self.selection_completed:
-            if event == cv.EVENT_LBUTTONDOWN:
-                self.drag_start = (x, y)
-                self.track_window = None
-
-            if self.drag_start:
-                xmin = min(x, self.drag_start[0])
-                ymin = min(y, self.drag_start[1])
-                xmax = max(x, self.drag_start[0])
-                ymax = max(y, self.drag_start[1])
-                self.user_selection_box = (xmin, ymin, xmax, ymax)
-
-            if event == cv.EVENT_LBUTTONUP:
-                self.drag_start = None
-                self.track_window = (xmin, ymin, xmax - xmin, ymax - ymin)
-                print("Got selection!")
-                print(self.track_window)
-
-                # compute histogram for selection
-                hsv = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV)
-                # mask = cv.inRange(hsv, np.array((70., 100., 50.)), np.array((150., 255., 255.)))
-                mask = cv.inRange(hsv, np.array((0., 0., 0.)), np.array((255., 255., 255.)))
-
-                x0, y0, x1, y1 = self.user_selection_box
-                hsv_roi = hsv[y0:y1, x0:x1]
-                mask_roi = mask[y0:y1, x0:x1]
-                hist = cv.calcHist( [hsv_roi], [0], mask_roi, [16], [0, 180] )
-                cv.normalize(hist, hist, 0, 255, cv.NORM_MINMAX)
-                self.hist = hist.reshape(-1)
-                self.selection_completed = True
-
-    def read_frame(self):
-        self.frame = read_frame_from_camera(self.camera)
-
-    def update(self):
-        hsv = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV)
-        mask = cv.inRange(hsv, np.array((0., 00., 127.)), np.array((180., 255., 255.)))
-
+import time
+
+# local modules
+from frame_context import FrameContext, scale_rect, scale_box
+from predictor import KalmanPredictor
+from tracker import Tracker
+import instrument
+
+
+class Target:
+    # Everything CamshiftTracker knows about one tracked object.
+    def __init__(self, hist, track_window, predictor=None):
+        self.hist = hist
+        self.track_window = track_window
+        self.initial_window = track_window
+        self.predictor = predictor
+
+        # until the first confident update, the middle of the selection
+        x, y, w, h = track_window
+        self.point = (int(x + w / 2), int(y + h / 2))
+        self.track_box = ((x + w / 2, y + h / 2), (w, h), 0.0)
+        self.confidence = 0.0
+
+        self._margin = None
+        self._reacquire = False
+        self._frame_count = 0
+
+
+def selection_hist(hsv, box):
+    # hue histogram of the (x0, y0, x1, y1) box
+    # mask = cv.inRange(hsv, np.array((70., 100., 50.)), np.array((150., 255., 255.)))
+    mask = cv.inRange(hsv, np.array((0., 0., 0.)), np.array((255., 255., 255.)))
+
+    x0, y0, x1, y1 = box
+    hsv_roi = hsv[y0:y1, x0:x1]
+    mask_roi = mask[y0:y1, x0:x1]
+    hist = cv.calcHist( [hsv_roi], [0], mask_roi, [16], [0, 180] )
+    cv.normalize(hist, hist, 0, 255, cv.NORM_MINMAX)
+
+    return hist.reshape(-1)
+
+
+class CamshiftTracker(Tracker):
+    # Tracks one or more targets (see add_target). All targets share the
+    # frame's HSV conversion and value mask, each one only costs its own
+    # backprojection and CamShift around its window. point, track_box and
+    # friends are those of the first target, points/track_boxes have all.
+    def __init__(self, predict=False, camera=None):
+        super().__init__(camera)
+
+        # With predict=True a constant velocity Kalman filter follows each
+        # point. It seeds CamShift with where the object should be now,
+        # lets predicted_point() extrapolate ahead, and allows skipping the
+        # real update on all but every update_stride-th frame.
+        self.predict = predict
+        self.update_stride = 1
+
+        # only pixels bright enough count towards the backprojection
+        self.value_lower = (0., 0., 127.)
+        self.value_upper = (180., 255., 255.)
+
+        # search region around the last window, as a fraction of the window
+        # size added on each side. It doubles every frame the tracker is
+        # unsure, past max_search_margin the whole frame is searched.
+        self.search_margin = 1.0
+        self.max_search_margin = 8.0
+        self.min_confidence = 0.05
+
+    hist = property(lambda self: self._first('hist'))
+
+    def add_target(self, track_window, hist=None):
+        # Starts tracking the (x, y, w, h) window. Without a histogram, it
+        # is taken from that window in the last frame read.
+        if hist is None:
+            x, y, w, h = track_window
+            hsv = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV)
+            hist = selection_hist(hsv, (x, y, x + w, y + h))
+
+        target = Target(hist, track_window, KalmanPredictor() if self.predict else None)
+        target._margin = self.search_margin
+        self.targets.append(target)
+
+        return target
+
+    def save_model(self, path):
+        # Histograms, initial windows and thresholds, enough to start
+        # tracking again without asking anybody for a selection.
+        model = dict(
+            value_lower=list(self.value_lower),
+            value_upper=list(self.value_upper),
+            search_margin=self.search_margin,
+            max_search_margin=self.max_search_margin,
+            min_confidence=self.min_confidence,
+            targets=[dict(window=[int(v) for v in target.initial_window],
+                          hist=[round(float(v), 3) for v in target.hist])
+                     for target in self.targets])
+
+        with open(path, 'w') as model_file:
+            json.dump(model, model_file)
+
+    def load_model(self, path):
+        # replaces the current targets with the ones saved by save_model
+        with open(path) as model_file:
+            model = json.load(model_file)
+
+        self.value_lower = tuple(model['value_lower'])
+        self.value_upper = tuple(model['value_upper'])
+        self.search_margin = model['search_margin']
+        self.max_search_margin = model['max_search_margin']
+        self.min_confidence = model['min_confidence']
+
+        self.targets = []
+        for target in model['targets']:
+            self.add_target(tuple(target['window']), np.float32(target['hist']))
+        self.selection_completed = True
+
+    def search_region(self, target, window, frame_w, frame_h):
+        # window grown by the target's current margin on every side, clipped to the frame
+        if target._reacquire:
+            return 0, 0, frame_w, frame_h
+
+        x, y, w, h = window
+        mx = int(w * target._margin)
+        my = int(h * target._margin)
+        return max(0, x - mx), max(0, y - my), min(frame_w, x + w + mx), min(frame_h, y + h + my)
+
+    def _coast(self, target, t):
+        # skipped frame: move everything along with the prediction
+        x, y = target.predictor.predict(t)
+        dx = x - target.track_box[0][0]
+        dy = y - target.track_box[0][1]
+        _center, size, angle = target.track_box
+        target.track_box = ((x, y), size, angle)
+        wx, wy, ww, wh = target.track_window
+        target.track_window = (int(wx + dx), int(wy + dy), ww, wh)
+        target.point = (int(x), int(y))
+
+    @instrument.timed('track')
+    def update(self, ctx=None, timestamp=None):
+        # ctx is a FrameContext for the frame to track in, shared with
+        # whatever else works on that frame. Without one, tracks in the
+        # last frame read. timestamp is when the frame was captured
+        # (time.monotonic()), it only matters for prediction.
+        if ctx is None:
+            ctx = FrameContext(self.frame)
+        else:
+            self.frame = ctx.frame
+        t = time.monotonic() if timestamp is None else timestamp
+
+        if len(self.targets) > 1:
+            # if the search regions cover most of the frame anyway, convert
+            # and mask it in one go, the regions then just slice it
+            frame_h, frame_w = ctx.proc.shape[:2]
+            s = ctx.scale
+            area = 0
+            for target in self.targets:
+                if target.track_window:
+                    x0, y0, x1, y1 = self.search_region(target, scale_rect(target.track_window, s), frame_w, frame_h)
+                    area += (x1 - x0) * (y1 - y0)
+            if area > frame_w * frame_h // 2:
+                ctx.mask(self.value_lower, self.value_upper)
+
+        for target in self.targets:
+            self._update_target(target, ctx, t)
+
+    def _update_target(self, target, ctx, t):
         # TODO: figure out wtf this does
-        if self.track_window and self.track_window[2] > 0 and self.track_window[3] > 0:
-            prob = cv.calcBackProject([hsv], [0], self.hist, [0, 180], 1)
+        if target.track_window and target.track_window[2] > 0 and target.track_window[3] > 0:
+            predictor = target.predictor
+            predicting = predictor is not None and predictor.ready and not target._reacquire
+            target._frame_count += 1
+            if predicting and target._frame_count % self.update_stride:
+                self._coast(target, t)
+                return
+
+            window = target.track_window
+            if predicting:
+                # start CamShift where the object should be by now
+                px, py = predictor.predict(t)
+                x, y, w, h = window
+                full_h, full_w = ctx.frame.shape[:2]
+                window = (min(max(int(px - w / 2), 0), max(full_w - w, 0)),
+                          min(max(int(py - h / 2), 0), max(full_h - h, 0)), w, h)
+
+            # the context may be working on a downscaled frame, the window
+            # and the box are always kept in full frame coordinates
+            s = ctx.scale
+            if s != 1.0:
+                window = scale_rect(window, s)
+
+            # only backproject around the last window, CamShift won't look
+            # any further anyway
+            frame_h, frame_w = ctx.proc.shape[:2]
+            x0, y0, x1, y1 = self.search_region(target, window, frame_w, frame_h)
+            hsv = ctx.hsv_region(x0, y0, x1, y1)
+            mask = ctx.mask_region(self.value_lower, self.value_upper, x0, y0, x1, y1)
+
+            prob = cv.calcBackProject([hsv], [0], target.hist, [0, 180], 1)
             prob &= mask
             term_crit = ( cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, 10, 1 )
-            track_box, self.track_window = cv.CamShift(prob, self.track_window, term_crit)
+
+            if target._reacquire:
+                # start from the whole frame, CamShift homes in on the
+                # strongest blob
+                local = (0, 0, x1 - x0, y1 - y0)
+            else:
+                local = (window[0] - x0, window[1] - y0, window[2], window[3])
+            track_box, local = cv.CamShift(prob, local, term_crit)
+
+            lx, ly, lw, lh = local
+            confidence = 0.0
+            if lw > 0 and lh > 0:
+                confidence = prob[ly:ly + lh, lx:lx + lw].mean() / 255.0
+            target.confidence = confidence
+
+            if confidence < self.min_confidence:
+                # weak or lost: hold the last good position, look further
+                # next time, and once the margin gets silly search the
+                # whole frame
+                target._margin *= 2
+                target._reacquire = target._margin > self.max_search_margin
+                return
+
+            if target._reacquire and predictor is not None:
+                # the object may have jumped anywhere, old velocity is useless
+                predictor.reset()
+            target._margin = self.search_margin
+            target._reacquire = False
+
+            (cx, cy), size, angle = track_box
+            track_box = ((cx + x0, cy + y0), size, angle)
+            window = (lx + x0, ly + y0, lw, lh)
+            if s != 1.0:
+                track_box = scale_box(track_box, 1 / s)
+                window = scale_rect(window, 1 / s)
+            target.track_window = window
 
             x = int(track_box[0][0])
             y = int(track_box[0][1])
-            self.point = (x, y)
-            self.track_box = track_box
-
-    def update_all(self):
-        self.read_frame()
-        self.update()
-
-
-def get_new_video_source():
-    video_src = 0
-    camera = video.create_capture(video_src, presets['cube'])
+            target.point = (x, y)
+            target.track_box = track_box
 
-    return camera
+            if predictor is not None:
+                predictor.correct(track_box[0], t)
 
 
-def read_frame_from_camera(camera):
-    # Reads frame from camera, and flips it.
-    ret_value, frame = camera.read()
-    frame = cv.flip(frame, 1)
+if __name__ == "__main__":
+    import getopt
 
-    assert ret_value, "Something went horribly wrong, unable to read frame from camera!"
+    # --model <path>: start tracking straight away with a saved model
+    # --save-model <path>: save the model after the selection
+    args, _ = getopt.getopt(sys.argv[1:], '', ['model=', 'save-model='])
+    args = dict(args)
 
-    return frame
+    # local module
+    import display
 
-if __name__ == "__main__":
     ct = CamshiftTracker()
-    cv.namedWindow("main")
+    disp = display.default_display()
+    disp.open("main")
+
+    if '--model' in args:
+        ct.load_model(args['--model'])
+        ct.read_frame()
 
     # first wait for the user to press s,
     # then take a selection
-    while True:
-        ch = cv.waitKey(5)
+    while not ct.targets:
+        ch = disp.key(0.005)
 
         if ch == 27:
             # escape pressed
@@ -129,11 +281,14 @@ if __name__ == "__main__":
             break
 
         ct.read_frame()
-        cv.imshow("main", ct.get_last_frame())
+        disp.show("main", ct.get_last_frame())
+
+    if '--save-model' in args:
+        ct.save_model(args['--save-model'])
 
     # now track that
     while True:
-        ch = cv.waitKey(5)
+        ch = disp.key()
 
         if ch == 27:
             # escape pressed
@@ -145,9 +300,9 @@ if __name__ == "__main__":
         # cv.circle(frame, ct.point, 10, (0, 0, 255), -1)
         cv.ellipse(frame, ct.track_box, (0, 0, 255), 2)
 
-        cv.imshow("main", frame)
+        disp.show("main", frame)
 
         print(ct.point)
 
     # cleanup!
-    cv.destroyAllWindows()
+    disp.shutdown()
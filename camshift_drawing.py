@@ -5,9 +5,12 @@ import math
 import numpy as np
 import cv2 as cv
 
-# local module
+# local modules
 import video
 from video import presets
+import capture
+import display
+from frame_context import FrameContext
 
 # colors (in BGR, idk why)
 RED = (0, 0, 255)
@@ -17,7 +20,8 @@ BLUE = (255, 0, 0)
 
 def get_video_source():
     video_src = 0
-    camera = video.create_capture(video_src, presets['cube'])
+    # read on a separate thread, always hand out the newest frame
+    camera = capture.ThreadedCapture(video.create_capture(video_src, presets['cube']))
 
     return camera
 
@@ -62,14 +66,19 @@ class Canvas:
 
 
 class App:
-    def __init__(self):
+    # camera and window can be swapped out, bench_pipelines runs the app
+    # off a synthetic source with window=None
+    def __init__(self, camera=None, window='camshift'):
         # Create a video capture source
-        self.cam = get_video_source()
+        self.cam = camera if camera is not None else get_video_source()
         self.frame = read_frame_from_camera(self.cam)
 
         # Create a window and mouse callback
-        cv.namedWindow('camshift')
-        cv.setMouseCallback('camshift', self.onmouse)
+        self.window = window
+        self.display = None
+        if window is not None:
+            self.display = display.default_display()
+            self.display.open(window)
 
         # Selection stuff. It's complicated, ok
         self.user_selection_box = None
@@ -117,20 +126,28 @@ class App:
         while True:
             self.update()
 
-            ch = cv.waitKey(5)
+            ch = self.display.key()
             if ch == 27:
-                return
+                break
             if ch == ord('b'):
                 self.show_backproj = not self.show_backproj
 
-        cv.destroyAllWindows()
+        self.display.shutdown()
 
     def update(self):
+        for event, x, y, flags in self.display.mouse_events(self.window):
+            self.onmouse(event, x, y, flags, None)
+
         self.frame = read_frame_from_camera(self.cam)
-        final_img = self.frame.copy()
-        hsv = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV)
-        # mask = cv.inRange(hsv, np.array((70., 100., 50.)), np.array((150., 255., 255.)))
-        mask = cv.inRange(hsv, np.array((0., 60., 32.)), np.array((180., 255., 255.)))
+        self.display.show(self.window, self.process(self.frame))
+
+    def process(self, frame):
+        # tracks and paints on one frame, returns the image to show
+        final_img = frame.copy()
+        ctx = FrameContext(frame)
+        hsv = ctx.hsv
+        # mask = ctx.mask((70., 100., 50.), (150., 255., 255.))
+        mask = ctx.mask((0., 60., 32.), (180., 255., 255.))
 
         if self.user_selection_box:
             x0, y0, x1, y1 = self.user_selection_box
@@ -164,7 +181,7 @@ class App:
             final_img = cv.add(final_img, self.canvas.image)
             cv.ellipse(final_img, track_box, (0, 0, 255), 2)
 
-        cv.imshow('camshift', final_img)
+        return final_img
 
 
 if __name__ == '__main__':
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# local module
+import instrument
+
+# what happens when the consumer can't keep up
+DROP_OLDEST = 'drop_oldest'   # frames come out in order, the oldest unread one is overwritten when the ring is full
+BLOCK = 'block'               # frames come out in order, capture waits for a free buffer
+LATEST = 'latest'             # read() always returns the newest frame, everything older is dropped
+
+
+class ThreadedCapture:
+    # Wraps anything with a VideoCapture-like read() (e.g. what
+    # video.create_capture returns) and reads from it on its own thread into
+    # a fixed ring of preallocated buffers.
+    #
+    # The frame returned by read() belongs to the ring: it stays valid until
+    # the next read(), copy it if you need to keep it longer.
+    #
+    # recorder (e.g. a session.SessionRecorder) gets every captured frame
+    # with its timestamp on the capture thread, including the ones that end
+    # up dropped. release() closes it.
+    def __init__(self, source, slots=3, policy=LATEST, recorder=None):
+        assert slots >= 2, "ThreadedCapture needs at least 2 slots (one is always held by the consumer)."
+
+        self.source = source
+        self.policy = policy
+        self.recorder = recorder
+        self.n_slots = slots
+
+        self.slots = None
+        self.timestamps = [0.0] * slots
+        self.seqs = [0] * slots
+
+        self._ready = deque()
+        self._free = deque(range(slots))
+        self._held = None
+        self._cond = threading.Condition()
+        self._running = True
+        self._eof = False
+
+        # counters
+        self.captured = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.duplicated = 0
+
+        self._thread = threading.Thread(target=self._run, name='capture', daemon=True)
+        self._thread.start()
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def stats(self):
+        return dict(captured=self.captured, delivered=self.delivered,
+                    dropped=self.dropped, duplicated=self.duplicated)
+
+    def _take_free_slot(self):
+        # called with the lock held, returns None when shutting down
+        while self._running:
+            if self._free:
+                return self._free.popleft()
+            if self.policy != BLOCK and self._ready:
+                self.dropped += 1
+                instrument.count('capture.dropped')
+                return self._ready.popleft()
+            self._cond.wait()
+
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                idx = self._take_free_slot()
+            if idx is None:
+                return
+
+            buf = self.slots[idx] if self.slots is not None else None
+            with instrument.span('capture.read'):
+                ret, frame = self.source.read(buf)
+            timestamp = time.monotonic()
+            instrument.count('capture.frames')
+            if ret and self.recorder is not None:
+                self.recorder.write(frame, timestamp)
+
+            with self._cond:
+                if not ret:
+                    self._eof = True
+                    self._cond.notify_all()
+                    return
+
+                if self.slots is None:
+                    # first frame tells us the size of the ring buffers
+                    self.slots = [np.empty_like(frame) for _ in range(self.n_slots)]
+                if frame is not self.slots[idx]:
+                    np.copyto(self.slots[idx], frame)
+
+                self.captured += 1
+                self.seqs[idx] = self.captured
+                self.timestamps[idx] = timestamp
+                self._ready.append(idx)
+                self._cond.notify_all()
+
+    def read(self, timeout=None):
+        # Returns (ret, frame) like VideoCapture.read. If no new frame
+        # arrives within timeout, the previous frame is returned again and
+        # counted as a duplicate.
+        with self._cond:
+            if not self._ready and not self._eof:
+                self._cond.wait_for(lambda: self._ready or self._eof, timeout)
+
+            if not self._ready:
+                if self._held is not None and not self._eof:
+                    self.duplicated += 1
+                    instrument.count('capture.duplicated')
+                    return True, self.slots[self._held]
+                return False, None
+
+            if self.policy == LATEST:
+                while len(self._ready) > 1:
+                    self.dropped += 1
+                    instrument.count('capture.dropped')
+                    self._free.append(self._ready.popleft())
+
+            if self._held is not None:
+                self._free.append(self._held)
+            self._held = self._ready.popleft()
+            self.delivered += 1
+            self._cond.notify_all()
+
+            return True, self.slots[self._held]
+
+    def last_timestamp(self):
+        # capture time (time.monotonic) of the frame last returned by read()
+        return self.timestamps[self._held] if self._held is not None else None
+
+    def release(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+
+        if self.recorder is not None:
+            self.recorder.close()
+        if hasattr(self.source, 'release'):
+            self.source.release()
@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import cv2 as cv
+
+# local module
+import instrument
+
+
+class Display:
+    # One thread that owns every HighGUI window: it shows the newest frame
+    # of each window at most max_fps times a second, and queues up the key
+    # presses and mouse events, so the processing loops never sit in
+    # imshow/waitKey and run at the camera's rate however slow the GUI is.
+    #
+    # All HighGUI calls must go through here once it's running, HighGUI
+    # isn't safe to use from two threads at once.
+    #
+    #   disp.open('main')
+    #   disp.show('main', frame)          # copies the frame, never blocks
+    #   ch = disp.key()                   # instead of cv.waitKey, -1 if none
+    #   for event, x, y, flags in disp.mouse_events('main'): ...
+    def __init__(self, max_fps=60):
+        self.max_fps = max_fps
+
+        self._windows = {}
+        self._keys = queue.Queue()
+        self._commands = queue.Queue()
+        self._lock = threading.Lock()
+        self._running = True
+
+        # counters
+        self.shown = 0
+        self.skipped = 0
+
+        self._thread = threading.Thread(target=self._run, name='display', daemon=True)
+        self._thread.start()
+
+    def open(self, name):
+        with self._lock:
+            self._windows[name] = _Window()
+        self._commands.put(('open', name))
+
+    def close(self, name):
+        with self._lock:
+            self._windows.pop(name, None)
+        self._commands.put(('close', name))
+
+    def show(self, name, frame):
+        # Frames that come faster than the display shows them replace each
+        # other, only the newest is ever shown.
+        with self._lock:
+            window = self._windows[name]
+            if window.frame is None or window.frame.shape != frame.shape:
+                window.frame = frame.copy()
+            else:
+                if window.fresh:
+                    self.skipped += 1
+                    instrument.count('display.skipped')
+                np.copyto(window.frame, frame)
+            window.fresh = True
+
+    def key(self, timeout=None):
+        # Next key pressed (like cv.waitKey, -1 if there wasn't any). By
+        # default doesn't wait at all.
+        try:
+            return self._keys.get(timeout is not None, timeout)
+        except queue.Empty:
+            return -1
+
+    def mouse_events(self, name):
+        # (event, x, y, flags) of everything that happened in the window
+        # since the last call
+        with self._lock:
+            window = self._windows.get(name)
+            if window is None:
+                return []
+            events, window.mouse = window.mouse, []
+        return events
+
+    def shutdown(self):
+        self._running = False
+        self._thread.join()
+
+    def _on_mouse(self, name):
+        def callback(event, x, y, flags, param):
+            with self._lock:
+                window = self._windows.get(name)
+                if window is not None:
+                    window.mouse.append((event, x, y, flags))
+        return callback
+
+    def _run(self):
+        period = 1.0 / self.max_fps
+
+        while self._running:
+            start = time.monotonic()
+
+            while not self._commands.empty():
+                command, name = self._commands.get()
+                if command == 'open':
+                    cv.namedWindow(name)
+                    cv.setMouseCallback(name, self._on_mouse(name))
+                else:
+                    cv.destroyWindow(name)
+
+            # swap the buffers so show() can carry on while we draw
+            fresh = []
+            with self._lock:
+                for name, window in self._windows.items():
+                    if window.fresh:
+                        window.frame, window.back = window.back, window.frame
+                        window.fresh = False
+                        fresh.append((name, window.back))
+            for name, frame in fresh:
+                with instrument.span('display.show'):
+                    cv.imshow(name, frame)
+                self.shown += 1
+
+            ch = cv.waitKey(1)
+            if ch != -1:
+                self._keys.put(ch)
+
+            delay = period - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        cv.destroyAllWindows()
+
+
+class _Window:
+    def __init__(self):
+        # show() writes frame, the display thread draws back
+        self.frame = None
+        self.back = None
+        self.fresh = False
+        self.mouse = []
+
+
+_default_display = None
+
+
+def default_display():
+    # the display everything in the process shares, started on first use
+    global _default_display
+    if _default_display is None:
+        _default_display = Display()
+
+    return _default_display
@@ -0,0 +1,96 @@
+import numpy as np
+import cv2 as cv
+
+# local module
+import instrument
+
+
+def scale_rect(rect, s):
+    # (x, y, w, h) window scaled by s, never collapsing to nothing
+    x, y, w, h = rect
+    return (int(round(x * s)), int(round(y * s)), max(1, int(round(w * s))), max(1, int(round(h * s))))
+
+
+def scale_box(box, s):
+    # rotated rect ((cx, cy), (w, h), angle) as returned by CamShift
+    (cx, cy), (w, h), angle = box
+    return ((cx * s, cy * s), (w * s, h * s), angle)
+
+
+class FrameContext:
+    # Wraps one camera frame and computes derived versions of it (HSV, the
+    # denoised frame, threshold masks, ...) lazily, at most once. Hand the
+    # same context to the tracker, the keyer and the compositor and nothing
+    # gets converted twice.
+    #
+    # `denoise` is the function used for `denoised`, e.g.
+    # background_subtraction.denoise. Without one, denoised is the raw frame.
+    #
+    # With scale < 1 everything derived (proc, hsv, denoised, masks) lives on
+    # a downscaled copy of the frame, `frame` stays full resolution. Anyone
+    # working in pixel coordinates has to map them with scale_rect/scale_box.
+    def __init__(self, frame, denoise=None, scale=1.0):
+        self.frame = frame
+        self.scale = scale
+        self._denoise = denoise
+        self._cache = {}
+
+    def cached(self, key, compute):
+        # generic memo for anything else that's derived from this frame
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = compute()
+            return value
+
+    @property
+    def proc(self):
+        # the frame at processing scale
+        if self.scale == 1.0:
+            return self.frame
+        return self.cached('proc', lambda: cv.resize(self.frame, None, fx=self.scale, fy=self.scale,
+                                                     interpolation=cv.INTER_AREA))
+
+    @property
+    def hsv(self):
+        return self.cached('hsv', lambda: cv.cvtColor(self.proc, cv.COLOR_BGR2HSV))
+
+    @property
+    def denoised(self):
+        if self._denoise is None:
+            return self.proc
+        return self.cached('denoised', lambda: self._denoise(self.proc))
+
+    @property
+    def denoised_hsv(self):
+        if self._denoise is None:
+            return self.hsv
+        return self.cached('denoised_hsv', lambda: cv.cvtColor(self.denoised, cv.COLOR_BGR2HSV))
+
+    def hsv_region(self, x0, y0, x1, y1):
+        # HSV of part of the processing frame. Slices the full conversion if
+        # somebody already paid for it, otherwise converts just the region.
+        if 'hsv' in self._cache:
+            return self._cache['hsv'][y0:y1, x0:x1]
+        return cv.cvtColor(self.proc[y0:y1, x0:x1], cv.COLOR_BGR2HSV)
+
+    def mask_region(self, lower, upper, x0, y0, x1, y1):
+        key = ('mask', tuple(lower), tuple(upper), False)
+        if key in self._cache:
+            return self._cache[key][y0:y1, x0:x1]
+        return cv.inRange(self.hsv_region(x0, y0, x1, y1), np.asarray(lower, np.float64), np.asarray(upper, np.float64))
+
+    def mask(self, lower, upper, denoised=False):
+        # inRange on the (denoised) HSV frame, cached per threshold. Keying
+        # is timed as 'key' once per frame and threshold, whoever asks
+        # first, without the denoise (that's timed on its own).
+        key = ('mask', tuple(lower), tuple(upper), denoised and self._denoise is not None)
+        # resize and denoise first, outside the span
+        self.denoised if denoised else self.proc
+
+        def compute():
+            with instrument.span('key'):
+                hsv = self.denoised_hsv if denoised else self.hsv
+                return cv.inRange(hsv, np.asarray(lower, np.float64), np.asarray(upper, np.float64))
+
+        return self.cached(key, compute)
@@ -0,0 +1,91 @@
+import time
+from collections import namedtuple
+
+# One step on the quality ladder:
+#   scale    processing scale of the FrameContext (keying, denoise, tracking)
+#   median   medianBlur kernel of the denoise, 0 to skip it
+#   gauss    GaussianBlur kernel of the denoise, 0 to skip it
+#   stride   tracker update_stride (needs predict=True to mean anything)
+#   trail    number of points in the trail drawn behind the tracked point
+Quality = namedtuple('Quality', 'scale median gauss stride trail')
+
+# best first, each one cheaper than the one before
+LEVELS = (
+    Quality(scale=1.0, median=5, gauss=5, stride=1, trail=20),
+    Quality(scale=1.0, median=3, gauss=3, stride=1, trail=20),
+    Quality(scale=0.5, median=3, gauss=3, stride=1, trail=15),
+    Quality(scale=0.5, median=0, gauss=3, stride=1, trail=15),
+    Quality(scale=0.5, median=0, gauss=0, stride=2, trail=10),
+    Quality(scale=0.25, median=0, gauss=0, stride=2, trail=10),
+    Quality(scale=0.25, median=0, gauss=0, stride=3, trail=5),
+)
+
+
+class Governor:
+    # Holds a target frame rate by trading quality for speed. Feed it the
+    # processing time of every frame (frame_done), it averages them over
+    # `window` frames and moves through `levels`:
+    #
+    #   - one level down (cheaper) when the average goes over the budget
+    #   - one level up when it's under up_at * budget and nothing changed
+    #     for `hold` seconds
+    #
+    # If going up has to be undone within 2 * hold, the level above was too
+    # much and hold doubles (up to max_hold), so it doesn't keep bouncing
+    # between two levels. Every change is logged through `log`.
+    def __init__(self, target_fps=30.0, levels=LEVELS, level=0, window=30,
+                 up_at=0.7, hold=2.0, max_hold=60.0, log=print):
+        self.budget = 1.0 / target_fps
+        self.levels = levels
+        self.level = level
+        self.window = window
+        self.up_at = up_at
+        self.hold = hold
+        self.max_hold = max_hold
+        self.log = log
+
+        self._times = []
+        self._changed_at = time.monotonic()
+        self._went_up_at = None
+
+        # counters
+        self.changes = 0
+
+    @property
+    def quality(self):
+        return self.levels[self.level]
+
+    def frame_done(self, seconds):
+        # Processing time of one frame. Returns the new Quality when the
+        # level changes, None otherwise.
+        self._times.append(seconds)
+        if len(self._times) < self.window:
+            return None
+
+        mean = sum(self._times) / len(self._times)
+        self._times = []
+        now = time.monotonic()
+
+        if mean > self.budget and self.level < len(self.levels) - 1:
+            if self._went_up_at is not None and now - self._went_up_at < 2 * self.hold:
+                self.hold = min(self.hold * 2, self.max_hold)
+            self._went_up_at = None
+            return self._set(self.level + 1, mean, now)
+
+        if mean < self.up_at * self.budget and self.level > 0 and now - self._changed_at >= self.hold:
+            self._went_up_at = now
+            return self._set(self.level - 1, mean, now)
+
+        return None
+
+    def _set(self, level, mean, now):
+        old = self.level
+        self.level = level
+        self._changed_at = now
+        self.changes += 1
+
+        if self.log is not None:
+            self.log('quality {} -> {} (frame {:.1f} ms, budget {:.1f} ms): {}'.format(
+                old, level, mean * 1000, self.budget * 1000, self.quality))
+
+        return self.quality
@@ -0,0 +1,226 @@
+'''
+Spans (how long something took) and counters (how often something
+happened) for the processing and audio paths, kept as rolling histograms of
+the last few hundred samples. Off by default, and then a span costs about as
+much as a function call.
+
+    instrument.enable()
+    with instrument.span('key'):
+        ...
+    @instrument.timed('track')
+    def update(...): ...
+    instrument.count('capture.dropped')
+
+    instrument.export('metrics.prom')       # Prometheus text format
+    instrument.export('metrics.json')       # or JSON, picked by extension
+    instrument.export_every('metrics.prom') # rewritten every second
+    instrument.draw_hud(frame)              # numbers on the frame
+
+For a timeline of the same events see tracer.py.
+'''
+
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# local modules
+import common
+
+# samples each histogram keeps
+HISTORY = 512
+
+enabled = False
+# set by tracer.start, gets every span, record and count as well
+tracer = None
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class Histogram:
+    # the last HISTORY samples plus totals since the start
+    def __init__(self, size=HISTORY):
+        self.values = np.zeros(size)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self.values[self.count % len(self.values)] = value
+            self.count += 1
+            self.total += value
+
+    def summary(self):
+        with self._lock:
+            recent = self.values[:min(self.count, len(self.values))].copy()
+            count, total = self.count, self.total
+        if not len(recent):
+            return dict(count=0, sum=0.0, mean=0.0, p50=0.0, p95=0.0, p99=0.0, max=0.0)
+
+        p50, p95, p99 = np.percentile(recent, (50, 95, 99))
+        return dict(count=count, sum=total, mean=float(recent.mean()),
+                    p50=float(p50), p95=float(p95), p99=float(p99), max=float(recent.max()))
+
+
+def histogram(name):
+    try:
+        return _histograms[name]
+    except KeyError:
+        with _lock:
+            return _histograms.setdefault(name, Histogram())
+
+
+def record(name, seconds, args=None):
+    # adds a duration measured some other way, that ended just now
+    if enabled:
+        histogram(name).add(seconds)
+        if tracer is not None:
+            end = time.perf_counter()
+            tracer.complete(name, end - seconds, end, args)
+
+
+def value(name, v):
+    # adds a value that isn't the duration of something (a delay, a depth)
+    if enabled:
+        histogram(name).add(v)
+        if tracer is not None:
+            tracer.counter(name, v)
+
+
+def count(name, n=1):
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+        if tracer is not None:
+            tracer.instant(name)
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        histogram(self.name).add(end - self.start)
+        if tracer is not None:
+            tracer.complete(self.name, self.start, end)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    # context manager timing its body into the histogram `name`
+    return _Span(name) if enabled else _NULL_SPAN
+
+
+def timed(name):
+    # decorator, the whole function as a span
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with _Span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    # {'spans': {name: summary in seconds}, 'counters': {name: n}}
+    with _lock:
+        histograms = list(_histograms.items())
+        counters = dict(_counters)
+
+    return dict(spans={name: h.summary() for name, h in sorted(histograms)}, counters=counters)
+
+
+def prometheus_text(snap=None):
+    snap = snapshot() if snap is None else snap
+    lines = ['# TYPE theremin_span_seconds summary']
+    for name, s in snap['spans'].items():
+        for q in ('p50', 'p95', 'p99'):
+            lines.append('theremin_span_seconds{{span="{}",quantile="0.{}"}} {:.6f}'.format(name, q[1:], s[q]))
+        lines.append('theremin_span_seconds_sum{{span="{}"}} {:.6f}'.format(name, s['sum']))
+        lines.append('theremin_span_seconds_count{{span="{}"}} {}'.format(name, s['count']))
+
+    lines.append('# TYPE theremin_events_total counter')
+    for name, n in sorted(snap['counters'].items()):
+        lines.append('theremin_events_total{{event="{}"}} {}'.format(name, n))
+
+    return '\n'.join(lines) + '\n'
+
+
+def export(path):
+    # .json gets JSON, anything else Prometheus text. The file is replaced
+    # in one go, so a scraper never sees half of it.
+    snap = snapshot()
+    if path.endswith('.json'):
+        text = json.dumps(snap, indent=1)
+    else:
+        text = prometheus_text(snap)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as out_file:
+        out_file.write(text)
+    os.replace(tmp_path, path)
+
+
+def export_every(path, interval=1.0):
+    # keeps rewriting path from the shared scheduler thread, returns the job
+    import timing
+    return timing.default_scheduler().add(interval, export, path)
+
+
+def draw_hud(frame, names=None, origin=(10, 20)):
+    # one line per span: mean and p95 in ms, then the counters
+    snap = snapshot()
+    x, y = origin
+    for name, s in snap['spans'].items():
+        if names is None or name in names:
+            common.draw_str(frame, (x, y), '{:18s} {:6.2f} ms  p95 {:6.2f}'.format(name, s['mean'] * 1000, s['p95'] * 1000))
+            y += 16
+    for name, n in sorted(snap['counters'].items()):
+        if names is None or name in names:
+            common.draw_str(frame, (x, y), '{:18s} {}'.format(name, n))
+            y += 16
@@ -0,0 +1,195 @@
+import heapq
+import queue
+import threading
+import time
+
+# local module
+import instrument
+
+# sentinel pushed through the queues on close()
+_END = object()
+
+
+class Stage:
+    # A named step of a Pipeline. `function` takes the item produced by the
+    # previous stage and returns the item for the next one. Stateful stages
+    # (like a tracker) must keep workers=1, stateless ones can use more.
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = workers
+
+        self.processed = 0
+        self.busy_time = 0.0
+        self._workers_done = 0
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            mean = self.busy_time / self.processed if self.processed else 0.0
+            return dict(processed=self.processed, busy_ms=self.busy_time * 1000, mean_ms=mean * 1000)
+
+
+class _OrderedInput:
+    # Hands out items from a queue strictly in sequence order, whatever
+    # order the upstream workers finished them in.
+    def __init__(self, q):
+        self.q = q
+        self.next_seq = 0
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            while not self.pending or self.pending[0][0] != self.next_seq:
+                heapq.heappush(self.pending, self.q.get())
+
+            seq, item = self.pending[0]
+            if item is _END:
+                # leave it there so every worker of the stage sees it
+                return seq, item
+
+            heapq.heappop(self.pending)
+            self.next_seq += 1
+            return seq, item
+
+
+class Pipeline:
+    # Runs items through a list of stages, each stage on its own worker
+    # thread(s), with bounded queues between them. Every item gets a
+    # sequence number when it enters, and results come out of get() in that
+    # order. OpenCV releases the GIL inside its kernels, so the stages really
+    # do overlap and throughput approaches that of the slowest stage.
+    #
+    # Items go in either through put() or, if `source` is given, from a
+    # thread calling source() until it returns None. If source() or a
+    # stage raises, the pipeline ends there and get() raises the same
+    # exception once the items before it are out.
+    def __init__(self, stages, source=None, maxsize=2):
+        self.stages = stages
+        self.source = source
+
+        self._queues = [queue.Queue(maxsize) for _ in range(len(stages) + 1)]
+        self._inputs = [_OrderedInput(q) for q in self._queues]
+        self._threads = []
+        self._seq = 0
+        self._closed = False
+        self._ended = False
+        self._end_lock = threading.Lock()
+        self._last_busy = {}
+        self.error = None
+
+    def start(self):
+        for i, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                t = threading.Thread(target=self._work, args=(stage, self._inputs[i], self._queues[i + 1]),
+                                     name='{}-{}'.format(stage.name, n), daemon=True)
+                t.start()
+                self._threads.append(t)
+
+        if self.source is not None:
+            t = threading.Thread(target=self._feed, name='source', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+        return self
+
+    def _work(self, stage, inp, out):
+        while True:
+            seq, item = inp.get()
+            if item is _END:
+                # the last worker of the stage passes the end on
+                with stage._lock:
+                    stage._workers_done += 1
+                    last = stage._workers_done == stage.workers
+                if last:
+                    out.put((seq, _END))
+                return
+
+            start = time.perf_counter()
+            try:
+                result = stage.function(item)
+            except Exception as e:
+                # This item will never come out. End the pipeline in its
+                # place, so get() raises once the items before it are out
+                # instead of waiting for it forever.
+                if self.error is None:
+                    self.error = e
+                self._closed = True
+                out.put((seq, _END))
+                return
+            elapsed = time.perf_counter() - start
+            instrument.record('stage.' + stage.name, elapsed, {'frame': seq})
+
+            with stage._lock:
+                stage.processed += 1
+                stage.busy_time += elapsed
+            out.put((seq, result))
+
+    def _feed(self):
+        try:
+            while not self._closed:
+                item = self.source()
+                if item is None:
+                    break
+                self.put(item)
+        except Exception as e:
+            self.error = e
+        finally:
+            # whatever happened, get() mustn't wait forever
+            self._end()
+
+    def put(self, item):
+        # blocks while the first stage is backed up
+        seq = self._seq
+        self._seq += 1
+        self._queues[0].put((seq, item))
+
+        return seq
+
+    def get(self):
+        # Next result in sequence order, as (seq, item). Returns (seq, None)
+        # once the pipeline has been closed and drained.
+        seq, item = self._inputs[-1].get()
+        if item is _END:
+            if self.error is not None:
+                raise self.error
+            return seq, None
+        return seq, item
+
+    def close(self):
+        # No more input, lets everything already queued drain through. With
+        # a source, its thread sends the end once it notices, so this never
+        # blocks, even when nobody is calling get() any more.
+        self._closed = True
+        if self.source is None:
+            self._end()
+
+    def _end(self):
+        # the end goes in once, after the last item
+        with self._end_lock:
+            if self._ended:
+                return
+            self._ended = True
+        self._closed = True
+        self._queues[0].put((self._seq, _END))
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def bottleneck(self):
+        # Seconds per item of the slowest stage since the last call, with
+        # the busy time shared out over the stage's workers. That's what
+        # limits the frame rate. None if nothing got through in between.
+        worst = None
+        for stage in self.stages:
+            with stage._lock:
+                busy, processed = stage.busy_time, stage.processed
+            last_busy, last_processed = self._last_busy.get(stage.name, (0.0, 0))
+            self._last_busy[stage.name] = (busy, processed)
+
+            if processed > last_processed:
+                per_item = (busy - last_busy) / (processed - last_processed) / stage.workers
+                worst = per_item if worst is None else max(worst, per_item)
+
+        return worst
@@ -0,0 +1,81 @@
+import threading
+
+import numpy as np
+import cv2 as cv
+
+
+class KalmanPredictor:
+    # Constant velocity Kalman filter over a 2D point, (x, y, vx, vy) state,
+    # with real timestamps so uneven frame intervals are fine. predict() can
+    # extrapolate to any moment, e.g. when the next audio block will play.
+    #
+    # Noise is per second: process_noise is how fast the velocity may
+    # change (px/s^2 squared-ish), measurement_noise is the jitter of the
+    # tracker in px^2.
+    #
+    # predict() never extrapolates more than max_ahead seconds past the last
+    # correction, a few frames plus the audio latency. Without corrections
+    # (the object is lost) the velocity is only a guess that gets worse.
+    def __init__(self, process_noise=5e4, measurement_noise=4.0, max_ahead=0.3):
+        self.process_noise = process_noise
+        self.max_ahead = max_ahead
+        self.kf = cv.KalmanFilter(4, 2)
+        self.kf.measurementMatrix = np.float32([[1, 0, 0, 0],
+                                                [0, 1, 0, 0]])
+        self.kf.measurementNoiseCov = np.eye(2, dtype=np.float32) * measurement_noise
+        self.t = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.t is not None
+
+    def reset(self):
+        with self._lock:
+            self.t = None
+
+    def correct(self, point, t):
+        # feed a measured position taken at time t (seconds, monotonic)
+        x, y = point
+        with self._lock:
+            if self.t is None:
+                self.kf.statePost = np.float32([[x], [y], [0], [0]])
+                self.kf.errorCovPost = np.diag(np.float32([10, 10, 1e4, 1e4]))
+                self.t = t
+                return
+
+            dt = max(t - self.t, 1e-3)
+            self.kf.transitionMatrix = np.float32([[1, 0, dt, 0],
+                                                   [0, 1, 0, dt],
+                                                   [0, 0, 1, 0],
+                                                   [0, 0, 0, 1]])
+            # white acceleration noise, integrated over dt
+            q = self.process_noise
+            self.kf.processNoiseCov = np.float32([[dt ** 3 / 3, 0, dt ** 2 / 2, 0],
+                                                  [0, dt ** 3 / 3, 0, dt ** 2 / 2],
+                                                  [dt ** 2 / 2, 0, dt, 0],
+                                                  [0, dt ** 2 / 2, 0, dt]]) * q
+            self.kf.predict()
+            self.kf.correct(np.float32([[x], [y]]))
+            self.t = t
+
+    def predict(self, t, max_age=None):
+        # Position extrapolated to time t (at most max_ahead), doesn't
+        # change the filter. None before the first correction, or if the
+        # last one is more than max_age seconds before t.
+        with self._lock:
+            if self.t is None:
+                return None
+            dt = t - self.t
+            if max_age is not None and dt > max_age:
+                return None
+            x, y, vx, vy = self.kf.statePost.ravel()
+            dt = min(dt, self.max_ahead)
+
+        return (x + vx * dt, y + vy * dt)
+
+    def velocity(self):
+        with self._lock:
+            if self.t is None:
+                return (0.0, 0.0)
+            return tuple(self.kf.statePost.ravel()[2:])
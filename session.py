@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+'''
+Records the raw camera frames of a session, with their capture timestamps,
+and replays them later as a video source (replay:<path> in
+video.create_capture) for benchmarks and repeatable tests.
+
+A session is the frames back to back as raw uint8 pixels in one file, plus a
+small JSON index next to it (see index_path) with the frame shape and the
+timestamp of every frame. Both sides memory-map the frame file: recording a
+frame is one copy into the mapping, replaying one is a read-only view.
+
+Usage:
+    session.py [--frames N] [--source SRC] <session path>
+
+records N frames (default 300) from SRC (default the camera) and prints how
+long writing them took.
+'''
+
+import json
+import os
+import time
+
+import numpy as np
+import cv2 as cv
+
+
+def index_path(session_path):
+    return os.path.splitext(session_path)[0] + '.idx'
+
+
+class SessionRecorder:
+    # Writes frames into a growing memory-mapped file. write() never waits
+    # on the disk, the kernel writes the pages back in the background.
+    # The file grows by chunk_frames frames at a time and is trimmed and
+    # indexed by close().
+    def __init__(self, path, chunk_frames=256):
+        self.path = path
+        self.chunk_frames = chunk_frames
+
+        self.shape = None
+        self.timestamps = []
+        self._file = open(path, 'w+b')
+        self._map = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _grow(self):
+        capacity = len(self.timestamps) + self.chunk_frames
+        frame_bytes = int(np.prod(self.shape))
+        self._file.truncate(capacity * frame_bytes)
+        self._map = np.memmap(self._file, np.uint8, 'r+', shape=(capacity,) + self.shape)
+
+    def write(self, frame, timestamp=None):
+        # timestamp is the capture time (time.monotonic), default now
+        if self.shape is None:
+            self.shape = frame.shape
+        assert frame.shape == self.shape, "All frames of a session must have the same size."
+
+        n = len(self.timestamps)
+        if self._map is None or n == len(self._map):
+            self._grow()
+
+        self._map[n] = frame
+        self.timestamps.append(time.monotonic() if timestamp is None else timestamp)
+
+    def close(self):
+        if self._file is None:
+            return
+
+        frame_bytes = int(np.prod(self.shape)) if self.shape else 0
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+        self._file.truncate(len(self.timestamps) * frame_bytes)
+        self._file.close()
+        self._file = None
+
+        with open(index_path(self.path), 'w') as idx_file:
+            json.dump(dict(dtype='uint8', shape=list(self.shape or ()), timestamps=self.timestamps), idx_file)
+
+
+class SessionReplay:
+    # VideoCapture-like source over a recorded session. read() hands out
+    # read-only views straight from the mapping (or copies into dst when
+    # given one). With realtime=True frames come at the pace they were
+    # recorded, otherwise as fast as they're asked for.
+    def __init__(self, path, realtime=True, loop=False):
+        with open(index_path(path)) as idx_file:
+            index = json.load(idx_file)
+
+        self.timestamps = index['timestamps']
+        shape = (len(self.timestamps),) + tuple(index['shape'])
+        self.frames = np.memmap(path, np.dtype(index['dtype']), 'r', shape=shape) if self.timestamps else []
+
+        self.realtime = realtime
+        self.loop = loop
+        self.pos = 0
+        self._start = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def isOpened(self):
+        return len(self.timestamps) > 0
+
+    def read(self, dst=None):
+        if self.pos == len(self.timestamps):
+            if not self.loop or not self.timestamps:
+                return False, None
+            self.pos = 0
+            self._start = None
+
+        if self.realtime:
+            # keep the recorded spacing between frames
+            offset = self.timestamps[self.pos] - self.timestamps[0]
+            if self._start is None:
+                self._start = time.monotonic() - offset
+            delay = self._start + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        frame = self.frames[self.pos]
+        self.pos += 1
+
+        if dst is None:
+            return True, frame
+        np.copyto(dst, frame)
+        return True, dst
+
+    def last_timestamp(self):
+        # recorded capture time of the frame last returned by read()
+        return self.timestamps[self.pos - 1] if self.pos else None
+
+    def get(self, prop):
+        n = len(self.timestamps)
+        if prop == cv.CAP_PROP_FRAME_COUNT:
+            return float(n)
+        if prop == cv.CAP_PROP_POS_FRAMES:
+            return float(self.pos)
+        if prop == cv.CAP_PROP_FPS and n > 1:
+            return (n - 1) / (self.timestamps[-1] - self.timestamps[0])
+        if n and prop == cv.CAP_PROP_FRAME_WIDTH:
+            return float(self.frames.shape[2])
+        if n and prop == cv.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frames.shape[1])
+        return 0.0
+
+    def release(self):
+        self.frames = []
+        self.timestamps = []
+
+
+if __name__ == '__main__':
+    import sys
+    import getopt
+
+    # local module
+    import video
+
+    args, paths = getopt.getopt(sys.argv[1:], '', ['frames=', 'source='])
+    args = dict(args)
+    if len(paths) != 1:
+        sys.exit(__doc__)
+
+    cap = video.create_capture(args.get('--source', 0), None)
+    recorder = SessionRecorder(paths[0])
+
+    write_time = 0.0
+    for _ in range(int(args.get('--frames', 300))):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        start = time.perf_counter()
+        recorder.write(frame)
+        write_time += time.perf_counter() - start
+    recorder.close()
+
+    print('{} frames, {:.2f} ms per write'.format(len(recorder), write_time / max(len(recorder), 1) * 1000))
@@ -1,65 +1,104 @@
 import cv2 as cv
 import sys
-import os
 
-# local module
-import timing
+# local modules
+import audio
+import tonebank
 
 class Theremin:
-    def __init__(self):
-        self.path = 'tones/pure/'
+    def __init__(self, sink=None, bank_path=tonebank.DEFAULT_PATH):
+        # The tones in tones/pure/ are played from the memory-mapped tone
+        # bank (packed on first use). With bank_path=None the engine
+        # synthesizes them with an oscillator instead.
+        #
+        # n_tones is how many tones there are to play, set_tone takes 0 up
+        # to n_tones - 1 (see tone_at). A regenerated bank with a finer
+        # grid gets a finer theremin.
+        voice = None
+        self.n_tones = audio.N_TONES
+        if bank_path is not None:
+            self.bank = tonebank.open_bank(bank_path)
+            entries = [self.bank.index_of(name) for name in self.bank.names if name.startswith('pure/')]
+            voice = audio.BankVoice(self.bank, entries)
+            self.n_tones = len(entries)
+
+        # sink defaults to piping raw PCM into aplay (play on a mac), see
+        # audio.default_sink
+        self.engine = audio.AudioEngine(sink, voice)
         self.current_tone = 0
-        self.rep_timer = None
-        self.interval = 0.1
         self.volume = 100
+        self.playing = False
 
     def start(self):
-        if not self.rep_timer:
-            self.rep_timer = timing.RepeatedTimer(self.interval, self.update)
-
-        else:
-            self.rep_timer.start()
+        self.engine.start()
+        self.engine.unmute()
+        self.playing = True
 
     def stop(self):
-        assert self.rep_timer, "You called stop on theremin without creating a rep timer."
+        self.engine.mute()
+        self.playing = False
 
-        self.rep_timer.stop()
+    def close(self):
+        self.playing = False
+        self.engine.close()
 
     def toggle(self):
-        if self.rep_timer.is_running:
+        if self.playing:
             self.stop()
         else:
             self.start()
 
-    def update(self):
-        path = '{}{:02d}.wav'.format(self.path, self.current_tone)
-        # print(path)
-
-        # use this on mac
-        # command = 'afplay {} -v {} &'.format(path, (self.volume // 10 +1))
-
-        # use this on linux
-        command = 'mplayer -really-quiet -af volume={} {} 2>&1 > /dev/null &'.format(int((self.volume / 100 - 1.0) * 20), path)
-        os.system(command)
-
+    # The control values go straight to the audio engine, which picks them
+    # up in its next block and keeps playing continuously in between.
     def set_tone(self, tone):
         self.current_tone = tone
+        self.engine.set_tone(tone)
 
     def set_volume(self, volume):
         self.volume = volume
+        self.engine.set_volume(volume)
+
+    def tone_at(self, fraction):
+        # tone for a position from 0 (lowest) to 1 (highest) on the pitch axis
+        return min(max(int(fraction * self.n_tones), 0), self.n_tones - 1)
+
+    @property
+    def tone_latency(self):
+        # seconds until a set_tone is heard: the engine renders ahead of
+        # the speaker, and a tone bank voice only switches at a loop's end
+        return self.engine.latency + self.engine.voice.delay
+
+    @property
+    def volume_latency(self):
+        # volume changes come in with the next block
+        return self.engine.latency
 
 
 if __name__ == "__main__":
+    import getopt
+
     # local modules needed
-    import camshift as cs
+    import tracker
+    import display
 
-    ct = cs.CamshiftTracker()
-    cv.namedWindow("main")
+    # --model <path>: start tracking straight away with a saved model
+    # --save-model <path>: save the model after the selection
+    # --tracker camshift|blob: which tracker to use, camshift by default
+    args, _ = getopt.getopt(sys.argv[1:], '', ['model=', 'save-model=', 'tracker='])
+    args = dict(args)
+
+    ct = tracker.create_tracker(args.get('--tracker', 'camshift'))
+    disp = display.default_display()
+    disp.open("main")
+
+    if '--model' in args:
+        ct.load_model(args['--model'])
+        ct.read_frame()
 
     # first wait for the user to press s,
     # then take a selection
-    while True:
-        ch = cv.waitKey(5)
+    while not ct.targets:
+        ch = disp.key(0.005)
 
         if ch == 27:
             # escape pressed
@@ -70,7 +109,10 @@ if __name__ == "__main__":
             break
 
         ct.read_frame()
-        cv.imshow("main", ct.get_last_frame())
+        disp.show("main", ct.get_last_frame())
+
+    if '--save-model' in args:
+        ct.save_model(args['--save-model'])
 
     tm = Theremin()
     tm.start()
@@ -78,7 +120,7 @@ if __name__ == "__main__":
     height, width, channels = ct.get_last_frame().shape
     # now track that
     while True:
-        ch = cv.waitKey(5)
+        ch = disp.key()
 
         if ch == 27:
             # escape pressed
@@ -89,14 +131,14 @@ if __name__ == "__main__":
 
         cv.ellipse(frame, ct.track_box, (0, 0, 255), 2)
 
-        cv.imshow("main", frame)
+        disp.show("main", frame)
 
-        tone = int(ct.point[0] / width * 100)
+        tone = tm.tone_at(ct.point[0] / width)
         vol = int((1 - (ct.point[1] / height)) * 200)
         print('t: {}, v: {}'.format(tone, vol))
         tm.set_tone(tone)
         tm.set_volume(vol)
 
     # cleanup!
-    tm.stop()
-    cv.destroyAllWindows()
+    tm.close()
+    disp.shutdown()
@@ -1,29 +1,78 @@
+import sys
+import time
+import getopt
 import cv2
 import numpy as np
 
 # local modules
-import camshift as cs
+import common
+import pipeline
+import audio
+import tracker
 import theremin
 import background_subtraction as bsub
+import backgrounds
+import session
+import display
+import governor
+import instrument
+import tracer
+import video_writer
+from frame_context import FrameContext
 
 
 def onmouse(event, x, y, flags, param):
-    global img_idx, tm
-
     if event == cv2.EVENT_LBUTTONDOWN:
-        img_idx = (img_idx + 1) % len(imgs)
+        bgs.advance()
     elif event == cv2.EVENT_MBUTTONDOWN:
         tm.toggle()
 
 
-ct = cs.CamshiftTracker()
-cv2.namedWindow("main")
-cv2.setMouseCallback('main', onmouse)
+# --model <path>: start tracking straight away with a saved model
+# --save-model <path>: save the model after the selection
+# --tracker camshift|blob: which tracker to use, camshift by default
+# --source <src>: anything video.create_capture takes, e.g. replay:<path>
+# --record <path>: record the raw camera session, see session.py
+# --save-video <path>: save the composited output with the theremin audio
+# --target-fps <fps>: lower the quality as needed to hold this frame rate
+#                     (30 by default, 0 keeps the quality fixed)
+# --metrics <path>: keep writing timings to path (.json or Prometheus text)
+# --hud: draw the timings on the output
+# --trace <path>: keep a timeline of every thread, written to path (Chrome
+#                 trace JSON) when t is pressed and on exit
+args, _ = getopt.getopt(sys.argv[1:], '', ['model=', 'save-model=', 'tracker=', 'source=', 'record=',
+                                           'save-video=', 'target-fps=', 'metrics=', 'hud', 'trace='])
+args = dict(args)
+
+if '--metrics' in args or '--hud' in args:
+    instrument.enable()
+if '--metrics' in args:
+    instrument.export_every(args['--metrics'])
+trace = tracer.start() if '--trace' in args else None
+
+recorder = session.SessionRecorder(args['--record']) if '--record' in args else None
+camera = tracker.get_new_video_source(args.get('--source', 0), recorder)
+
+# predict=True: the theremin gets the position extrapolated to when the
+# sound will actually play, instead of where the coat was a frame ago
+ct = tracker.create_tracker(args.get('--tracker', 'camshift'), predict=True, camera=camera)
+
+# one selection per performer, the first one plays the theremin
+NUM_TARGETS = 1
+# the window lives on the display thread, keys and clicks come through it
+disp = display.default_display()
+disp.open("main")
+
+if '--model' in args:
+    ct.load_model(args['--model'])
+    ct.read_frame()
 
 # first wait for the user to press s,
-# then take a selection
-while True:
-    ch = cv2.waitKey(5)
+# then take a selection (or one for each performer)
+while len(ct.targets) < NUM_TARGETS:
+    ch = disp.key(0.005)
+    # nothing to click on yet
+    disp.mouse_events("main")
 
     if ch == 27:
         # escape pressed
@@ -31,78 +80,151 @@ while True:
     elif ch == ord("s"):
         # create a selection
         ct.ask_for_selection()
-        break
+        if len(ct.targets) >= NUM_TARGETS:
+            break
 
     ct.read_frame()
-    cv2.imshow("main", ct.get_last_frame())
+    disp.show("main", ct.get_last_frame())
+
+if '--save-model' in args:
+    ct.save_model(args['--save-model'])
 
 # now track that
 tm = theremin.Theremin()
+
+# encoded on its own thread, frames are dropped rather than slowing us down
+writer = None
+if '--save-video' in args:
+    writer = video_writer.AsyncVideoWriter(args['--save-video'], audio=True)
+    tm.engine.sink = audio.TeeSink(tm.engine.sink, writer.audio)
 tm.start()
 bs = bsub.BackSub(ct.get_last_frame())
 thresh = 45
 
-imgs = []
-img_idx = 0
-
-for name in ('space.png', 'paris-1-.png', 'alley.png', 'lab.png', 'sharks.png'):
-    img = cv2.imread('backgrounds/{}'.format(name))
-    imgs.append(img)
-
 height, width, channels = ct.get_last_frame().shape
 
+# decoded lazily and already resized to the frame size
+bgs = backgrounds.BackgroundManager((width, height))
+
 point_hist = []
-MAX_POINTS = 20
 
-while True:
-    print("tick")
+# Processing scale (compositing is always done at full resolution), denoise
+# kernels, tracker stride and trail length come from a governor.LEVELS
+# entry. QUALITY is the one to start at, the governor moves from there to
+# hold the target frame rate.
+QUALITY = 0
+target_fps = float(args.get('--target-fps', 30))
+gov = governor.Governor(target_fps, level=QUALITY) if target_fps > 0 else None
+quality = governor.LEVELS[QUALITY]
+frame_denoise = bsub.denoiser(quality.median, quality.gauss)
+ct.update_stride = quality.stride
+
+
+# pipeline stages, each one runs on its own thread(s)
+def read_frame():
+    # every stage works off the same FrameContext, so the HSV conversions,
+    # masks and the denoised frame are each computed once
+    ret, frame = ct.camera.read()
+    if not ret:
+        # the replay is over (or the camera is gone), ends the pipeline
+        return None
+    frame = cv2.flip(frame, 1)
+    return common.Bunch(ctx=FrameContext(frame, frame_denoise, quality.scale),
+                        t=ct.camera.last_timestamp())
+
+
+def track(f):
+    # update camshift on the raw frame
+    ct.update(f.ctx, f.t)
+    f.point = ct.point
+    f.track_box = ct.track_box
+    f.track_boxes = ct.track_boxes
+    return f
+
+
+def denoise(f):
+    # denoise and key here so it overlaps with tracking the next frame
+    bs.getGreenMask(f.ctx)
+    return f
+
+
+def composite(f):
+    # background substitution in place, then draw the ellipses on top
+    f.final = bs.composite(f.ctx, bgs.current())
+
+    for tb in f.track_boxes:
+        if tb and tb[1][0] > 0 and tb[1][1] > 0:
+            cv2.ellipse(f.final, tb, (255, 255, 255), 2)
+    return f
+
+
+frames = pipeline.Pipeline([
+    pipeline.Stage('track', track),
+    pipeline.Stage('denoise', denoise, workers=2),
+    pipeline.Stage('composite', composite),
+], source=read_frame).start()
 
-    img = imgs[img_idx]
-    img = cv2.resize(img, (width, height))
-    ch = cv2.waitKey(5)
+while True:
+    ch = disp.key()
 
     if ch == 27:
         # escape pressed
         break
+    elif ch == ord("t") and trace is not None:
+        # the last minute or so, right after something looked wrong
+        print("trace written to", trace.dump(args['--trace']))
 
-    # update camshift, draw ellipse
-    ct.update_all()
-    frame = bsub.denoise(ct.get_last_frame())
-    tb = ct.track_box
-    print(tb)
-    if tb[1][0] > 0 and tb[1][1] > 0:
-        cv2.ellipse(frame, tb, (255, 255, 255), 2)
-
-    # background substitution
-    fgmask = bs.getForeground(frame)
+    for event, x, y, flags in disp.mouse_events("main"):
+        onmouse(event, x, y, flags, None)
 
-    # Apply thresholding on the background and display the resulting mask
-    frame &= fgmask
-
-    mask_inv = cv2.bitwise_not(fgmask)
-    masked_img = img & mask_inv
+    seq, f = frames.get()
+    if f is None:
+        break
+    final = f.final
 
-    final = cv2.add(frame, masked_img)
+    # the slowest stage decides the frame rate
+    cost = frames.bottleneck()
+    if gov is not None and cost is not None and gov.frame_done(cost):
+        # frames already in the pipeline finish at the old quality
+        quality = gov.quality
+        frame_denoise = bsub.denoiser(quality.median, quality.gauss)
+        ct.update_stride = quality.stride
 
     # theremin shenanigans
-    if len(point_hist) < MAX_POINTS:
-        point_hist.append(ct.point)
-    else:
-        # this is a really stupid way to do it
-        point_hist = point_hist[1:]
-        point_hist.append(ct.point)
+    point_hist.append(f.point)
+    point_hist = point_hist[-quality.trail:]
 
     for i in range(len(point_hist) - 1):
         start = point_hist[i]
         end = point_hist[i + 1]
         cv2.line(final, start, end, (0, 255, 0), 2)
-    cv2.imshow('main', final)
-
-    tone = int(ct.point[0] / width * 100)
-    vol = int((1 - (ct.point[1] / height)) ** 2 * 100)
+    if '--hud' in args:
+        instrument.draw_hud(final)
+    disp.show("main", final)
+    if writer is not None:
+        writer.write(final, f.t)
+
+    # the tone and the volume are heard at different times, each is taken
+    # from where the object will be by then
+    now = time.monotonic()
+    x, _ = ct.predicted_point(now + tm.tone_latency)
+    _, y = ct.predicted_point(now + tm.volume_latency)
+    x = min(max(x, 0), width - 1)
+    y = min(max(y, 0), height - 1)
+    tone = tm.tone_at(x / width)
+    vol = int((1 - (y / height)) ** 2 * 100)
     tm.set_tone(tone)
     tm.set_volume(vol)
 
 # cleanup!
-tm.stop()
-cv2.destroyAllWindows()
+frames.close()
+tm.close()
+if writer is not None:
+    writer.close()
+    print(writer.stats())
+bgs.close()
+# also finishes the recording
+ct.camera.release()
+disp.shutdown()
+if trace is not None:
+    trace.dump(args['--trace'])
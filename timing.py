@@ -1,30 +1,188 @@
-from threading import Timer
+import heapq
+import itertools
+import threading
+import time
+import traceback
 
+# local module
+import instrument
 
-class RepeatedTimer(object):
-    def __init__(self, interval, function, *args, **kwargs):
-        self._timer     = None
+# what to do when a job falls behind by more than one period
+SKIP = 'skip'            # drop the missed ticks, resume on the next deadline in the future
+CATCH_UP = 'catch_up'    # run every missed tick back to back until caught up
+
+
+class Job(object):
+    # A periodic job on a Scheduler. Deadlines are absolute (monotonic clock),
+    # so the period never drifts by however long the callback takes.
+    def __init__(self, scheduler, interval, function, args, kwargs, policy):
+        self.scheduler  = scheduler
         self.interval   = interval
         self.function   = function
         self.args       = args
         self.kwargs     = kwargs
+        self.policy     = policy
         self.is_running = False
-        self.start()
+        self.deadline   = None
+        self._generation = 0
+
+        # stats, all in seconds
+        self.runs         = 0
+        self.skipped      = 0
+        self.overruns     = 0
+        self.jitter_max   = 0.0
+        self.jitter_total = 0.0
+        self.duration_max = 0.0
+
+    @property
+    def jitter_mean(self):
+        return self.jitter_total / self.runs if self.runs else 0.0
+
+    def stats(self):
+        return dict(runs=self.runs, skipped=self.skipped, overruns=self.overruns,
+                    jitter_mean=self.jitter_mean, jitter_max=self.jitter_max,
+                    duration_max=self.duration_max)
+
+    def start(self):
+        self.scheduler._start_job(self)
+
+    def stop(self):
+        self.scheduler._stop_job(self)
+
+
+class Scheduler(object):
+    # Runs any number of periodic jobs on one persistent worker thread.
+    def __init__(self, name='scheduler'):
+        self.name    = name
+        self._heap   = []
+        self._seq    = itertools.count()
+        self._cond   = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def add(self, interval, function, *args, policy=SKIP, start=True, **kwargs):
+        job = Job(self, interval, function, args, kwargs, policy)
+        if start:
+            job.start()
+        return job
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _start_job(self, job):
+        with self._cond:
+            if job.is_running:
+                return
+            job.is_running = True
+            job._generation += 1
+            job.deadline = time.monotonic() + job.interval
+            self._push(job)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _stop_job(self, job):
+        with self._cond:
+            # the heap entry goes stale and gets dropped by the worker
+            job.is_running = False
+            job._generation += 1
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.deadline, next(self._seq), job._generation, job))
 
     def _run(self):
-        self.is_running = False
-        self.start()
-        self.function(*self.args, **self.kwargs)
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+
+                    deadline, _seq, generation, job = self._heap[0]
+                    if generation != job._generation:
+                        heapq.heappop(self._heap)
+                        continue
+
+                    delay = deadline - time.monotonic()
+                    if delay <= 0:
+                        heapq.heappop(self._heap)
+                        break
+                    self._cond.wait(delay)
+
+            started = time.monotonic()
+            try:
+                job.function(*job.args, **job.kwargs)
+            except Exception:
+                # one broken job shouldn't take every other job down with it
+                traceback.print_exc()
+            self._reschedule(job, started, time.monotonic())
+
+    def _reschedule(self, job, started, finished):
+        jitter = started - job.deadline
+        duration = finished - started
+
+        instrument.value('timer.jitter', jitter)
+        instrument.record('timer.' + getattr(job.function, '__name__', 'job'), duration)
+
+        job.runs += 1
+        job.jitter_total += jitter
+        job.jitter_max = max(job.jitter_max, jitter)
+        job.duration_max = max(job.duration_max, duration)
+        if duration > job.interval:
+            job.overruns += 1
+
+        with self._cond:
+            if not job.is_running or self._closed:
+                return
+
+            job.deadline += job.interval
+            if job.policy == SKIP and job.deadline < finished:
+                missed = int((finished - job.deadline) // job.interval) + 1
+                job.skipped += missed
+                job.deadline += missed * job.interval
+            self._push(job)
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler():
+    # shared scheduler for everything periodic in the process
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = Scheduler('default-scheduler')
+        return _default_scheduler
+
+
+class RepeatedTimer(object):
+    # Old interface, kept for existing callers. Runs on the shared scheduler
+    # instead of spawning a new threading.Timer every tick.
+    def __init__(self, interval, function, *args, **kwargs):
+        self._job = default_scheduler().add(interval, function, *args, **kwargs)
+
+    @property
+    def interval(self):
+        return self._job.interval
+
+    @property
+    def is_running(self):
+        return self._job.is_running
 
     def start(self):
-        if not self.is_running:
-            self._timer = Timer(self.interval, self._run)
-            self._timer.start()
-            self.is_running = True
+        self._job.start()
 
     def stop(self):
-        self._timer.cancel()
-        self.is_running = False
+        self._job.stop()
 
 
 class Ticker:
@@ -43,4 +201,7 @@ if __name__ == "__main__":
     def say_hello():
         print("hello!")
 
-    rt = RepeatedTimer(1, say_hello)
+    scheduler = default_scheduler()
+    job = scheduler.add(1, say_hello)
+    time.sleep(5.5)
+    print(job.stats())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+'''
+Packs every tone in tones/ and tones/pure/ into one contiguous int16 file
+plus a small JSON index, and memory-maps it back so playback can grab any
+tone as a zero-copy numpy view without touching the filesystem.
+
+Usage:
+    tonebank.py [--out <bank path>] [dir0] [dir1] ...
+'''
+
+import json
+import os
+import wave
+
+import numpy as np
+
+DEFAULT_DIRS = ('tones/pure', 'tones')
+DEFAULT_PATH = 'tones/tones.bank'
+
+
+def index_path(bank_path):
+    return os.path.splitext(bank_path)[0] + '.idx'
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as wav_file:
+        assert wav_file.getsampwidth() == 2, "Only 16 bit WAV files can go in the tone bank: {}".format(path)
+        channels = wav_file.getnchannels()
+        rate = wav_file.getframerate()
+        data = np.frombuffer(wav_file.readframes(wav_file.getnframes()), np.int16)
+
+    return data, channels, rate
+
+
+def pack(dirs=DEFAULT_DIRS, bank_path=DEFAULT_PATH):
+    # Names are relative to the common tones/ directory, e.g. 'pure/07' or 'a'.
+    root = os.path.commonpath(dirs)
+    entries = []
+    offset = 0
+
+    with open(bank_path, 'wb') as bank_file:
+        for d in dirs:
+            for fn in sorted(os.listdir(d)):
+                name, ext = os.path.splitext(fn)
+                if ext.lower() != '.wav':
+                    continue
+
+                data, channels, rate = read_wav(os.path.join(d, fn))
+                bank_file.write(data.tobytes())
+
+                rel = os.path.relpath(os.path.join(d, name), root)
+                entries.append(dict(name=rel.replace(os.sep, '/'), offset=offset,
+                                    frames=len(data) // channels, channels=channels, rate=rate))
+                offset += len(data)
+
+    with open(index_path(bank_path), 'w') as idx_file:
+        json.dump(dict(dtype='int16', entries=entries), idx_file, indent=1)
+
+
+class ToneBank:
+    def __init__(self, bank_path=DEFAULT_PATH):
+        with open(index_path(bank_path)) as idx_file:
+            self.entries = json.load(idx_file)['entries']
+
+        self.names = [e['name'] for e in self.entries]
+        self._by_name = {name: i for i, name in enumerate(self.names)}
+        self.data = np.memmap(bank_path, dtype=np.int16, mode='r')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def index_of(self, name):
+        return self._by_name[name]
+
+    def view(self, index):
+        # zero-copy: (frames,) for mono tones, (frames, channels) otherwise
+        e = self.entries[index]
+        samples = self.data[e['offset']:e['offset'] + e['frames'] * e['channels']]
+        if e['channels'] > 1:
+            samples = samples.reshape(e['frames'], e['channels'])
+        return samples
+
+    def rate(self, index):
+        return self.entries[index]['rate']
+
+
+def open_bank(bank_path=DEFAULT_PATH, dirs=DEFAULT_DIRS):
+    # packs the bank first if it hasn't been built yet
+    if not (os.path.exists(bank_path) and os.path.exists(index_path(bank_path))):
+        pack(dirs, bank_path)
+
+    return ToneBank(bank_path)
+
+
+if __name__ == '__main__':
+    import sys
+    import getopt
+
+    args, dirs = getopt.getopt(sys.argv[1:], '', ['out='])
+    args = dict(args)
+    bank_path = args.get('--out', DEFAULT_PATH)
+
+    pack(dirs or DEFAULT_DIRS, bank_path)
+    bank = ToneBank(bank_path)
+    print('packed {} tones into {}'.format(len(bank), bank_path))
@@ -1,83 +1,116 @@
-#!/usr/bin/python 
+#!/usr/bin/python
 # based on : www.daniweb.com/code/snippet263775.html
-import math
+'''
+Generates the bank of pure tones the theremin plays.
+
+Usage:
+    tone_generator.py [--grid linear|tempered] [--count N] [--start HZ]
+                      [--step HZ] [--steps-per-octave N] [--duration MS]
+                      [--out DIR] [--processes N]
+
+    linear   -- start, start + step, start + 2 * step, ...  (default: 10 Hz steps from 10 Hz)
+    tempered -- equal-tempered, steps-per-octave steps per doubling starting at start
+
+Files are named 00.wav, 01.wav, ... (zero-padded to fit the count).
+Remember to rerun tonebank.py afterwards.
+'''
+import os
 import wave
-import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 44100 is the industry standard sample rate - CD quality.  If you need to
+# save on file size you can adjust it downwards. The stanard for low quality
+# is 8000 or 8kHz.
+sample_rate = 44100
+
 
-# Audio will contain a long list of samples (i.e. floating point numbers describing the
-# waveform).  If you were working with a very long sound you'd want to stream this to
-# disk instead of buffering it all in memory list this.  But most sounds will fit in 
-# memory.
-sample_rate = 44100.0
+def linear_grid(count, start=10.0, step=10.0):
+    return start + step * np.arange(count)
 
 
-def append_sinewave(
-        audio,
-        freq=440.0, 
-        duration_milliseconds=500, 
+def tempered_grid(count, start=55.0, steps_per_octave=12):
+    # steps_per_octave=12 is the usual semitone scale, crank it up for
+    # finer pitch resolution
+    return start * 2.0 ** (np.arange(count) / steps_per_octave)
+
+
+def sinewave(
+        freq=440.0,
+        duration_milliseconds=500,
         volume=1.0):
     """
     The sine wave generated here is the standard beep.  If you want something
     more aggresive you could try a square or saw tooth waveform.   Though there
     are some rather complicated issues with making high quality square and
-    sawtooth waves... which we won't address here :) 
-    """ 
+    sawtooth waves... which we won't address here :)
+
+    The first and last tenth of the tone fade in and out linearly so it
+    doesn't click when it starts and stops.
+    """
 
     num_samples = duration_milliseconds * (sample_rate / 1000.0)
     fade_portion = num_samples / 10
 
-    for x in range(int(num_samples)):
-        point = volume * math.sin(2 * math.pi * freq * ( x / sample_rate ))
-        if x <= fade_portion:
-            fade_multiplier = x / fade_portion
-            point *= fade_multiplier
-
-        elif x >= num_samples - fade_portion:
-            start = num_samples - fade_portion
-            fade_multiplier = (fade_portion - (x - start)) / fade_portion
-            point *= fade_multiplier
+    x = np.arange(int(num_samples))
+    audio = volume * np.sin(2 * np.pi * freq * (x / sample_rate))
 
-        audio.append(point)
+    fade = np.minimum(x / fade_portion, (num_samples - x) / fade_portion)
+    audio *= np.clip(fade, 0.0, 1.0)
 
-    return
+    return audio
 
 
 def save_wav(audio, file_name):
-    # Open up a wav file
-    wav_file=wave.open(file_name,"w")
+    # WAV files here are using short, 16 bit, signed integers for the
+    # sample size.  So we multiply the floating point data we have by 32767, the
+    # maximum value for a short integer.
+    pcm = (audio * 32767.0).astype('<i2')
 
-    # wav params
-    nchannels = 1
+    with wave.open(file_name, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
 
-    sampwidth = 2
 
-    # 44100 is the industry standard sample rate - CD quality.  If you need to
-    # save on file size you can adjust it downwards. The stanard for low quality
-    # is 8000 or 8kHz.
-    nframes = len(audio)
-    comptype = "NONE"
-    compname = "not compressed"
-    wav_file.setparams((nchannels, sampwidth, sample_rate, nframes, comptype, compname))
+def _write_tone(job):
+    freq, duration_milliseconds, path = job
+    save_wav(sinewave(freq, duration_milliseconds), path)
 
-    # WAV files here are using short, 16 bit, signed integers for the 
-    # sample size.  So we multiply the floating point data we have by 32767, the
-    # maximum value for a short integer.  NOTE: It is theortically possible to
-    # use the floating point -1.0 to 1.0 data directly in a WAV file but not
-    # obvious how to do that using the wave module in python.
-    for sample in audio:
-        wav_file.writeframes(struct.pack('h', int( sample * 32767.0 )))
-
-    wav_file.close()
-
-    return
-
-for i in range(1, 100):
-    audio = []
-    print(i)
-    hz = i * 10
-    vol = 1 / (i ** 0.5)
-    # volume = 1 / (i
-    append_sinewave(audio, freq=hz, duration_milliseconds=100)
-
-    path = "{:02d}.wav".format(i - 1)
-    save_wav(audio, path)
+    return path
+
+
+def generate_bank(freqs, out_dir='.', duration_milliseconds=100, processes=None):
+    # Writes one file per frequency, spread across a process pool.
+    # Returns the list of paths in frequency order.
+    width = max(2, len(str(len(freqs) - 1)))
+    jobs = [(float(freq), duration_milliseconds, os.path.join(out_dir, '{:0{}d}.wav'.format(i, width)))
+            for i, freq in enumerate(freqs)]
+
+    os.makedirs(out_dir, exist_ok=True)
+    # big chunks, each tone is only a few hundred microseconds of work
+    chunksize = max(1, len(jobs) // (4 * (processes or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(_write_tone, jobs, chunksize=chunksize))
+
+
+if __name__ == '__main__':
+    import sys
+    import getopt
+
+    args, _ = getopt.getopt(sys.argv[1:], '', ['grid=', 'count=', 'start=', 'step=', 'steps-per-octave=',
+                                               'duration=', 'out=', 'processes='])
+    args = dict(args)
+
+    count = int(args.get('--count', 99))
+    if args.get('--grid', 'linear') == 'tempered':
+        freqs = tempered_grid(count, float(args.get('--start', 55.0)), float(args.get('--steps-per-octave', 12)))
+    else:
+        freqs = linear_grid(count, float(args.get('--start', 10.0)), float(args.get('--step', 10.0)))
+
+    processes = args.get('--processes')
+    paths = generate_bank(freqs, args.get('--out', '.'), float(args.get('--duration', 100)),
+                          int(processes) if processes else None)
+    print('wrote {} tones ({:.1f} - {:.1f} Hz)'.format(len(paths), freqs[0], freqs[-1]))
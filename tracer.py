@@ -0,0 +1,93 @@
+'''
+Timeline of what every thread did and when, for finding the stall behind a
+bad frame, which the averages in instrument.py smooth away. While a Tracer
+is running, every instrument span and record (pipeline stages, capture
+reads, audio blocks, timer ticks, keying...) becomes a slice on its
+thread's track. Every counted event (frame arrived, frame dropped...)
+becomes a marker, and values like the timer jitter become a plot. The
+newest events are kept in a ring.
+
+    t = tracer.start()
+    ...
+    t.dump('trace.json')
+
+Open the dump in https://ui.perfetto.dev or chrome://tracing.
+'''
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# local modules
+import instrument
+
+# events the ring keeps, about a minute of everything at 30 fps
+RING = 1 << 17
+
+
+class Tracer:
+    def __init__(self, size=RING):
+        self.events = deque(maxlen=size)
+        self.thread_names = {}
+        self.pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _add(self, event):
+        tid = threading.get_ident()
+        with self._lock:
+            if tid not in self.thread_names:
+                self.thread_names[tid] = threading.current_thread().name
+            self.events.append(event + (tid,))
+
+    def complete(self, name, start, end, args=None):
+        # a slice from start to end (time.perf_counter)
+        self._add(('X', name, start, end - start, args))
+
+    def instant(self, name, when=None):
+        self._add(('i', name, time.perf_counter() if when is None else when, 0.0, None))
+
+    def counter(self, name, value, when=None):
+        self._add(('C', name, time.perf_counter() if when is None else when, 0.0, {name: value}))
+
+    def trace_events(self):
+        # the ring as Chrome trace events, timestamps in microseconds
+        with self._lock:
+            events = list(self.events)
+            thread_names = list(self.thread_names.items())
+
+        trace = [dict(name='thread_name', ph='M', pid=self.pid, tid=tid, args=dict(name=name))
+                 for tid, name in thread_names]
+        for ph, name, start, duration, args, tid in events:
+            event = dict(name=name, ph=ph, pid=self.pid, tid=tid, ts=(start - self._origin) * 1e6)
+            if ph == 'X':
+                event['dur'] = duration * 1e6
+            elif ph == 'i':
+                event['s'] = 't'
+            if args:
+                event['args'] = args
+            trace.append(event)
+
+        return trace
+
+    def dump(self, path):
+        # writes what's in the ring, which keeps filling while this runs
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as out_file:
+            json.dump(dict(traceEvents=self.trace_events(), displayTimeUnit='ms'), out_file)
+        os.replace(tmp_path, path)
+        return path
+
+
+def start(size=RING):
+    # starts tracing (and instrument, the events come from its spans)
+    t = Tracer(size)
+    instrument.enable()
+    instrument.tracer = t
+    return t
+
+
+def stop():
+    instrument.tracer = None
@@ -0,0 +1,176 @@
+import time
+
+import cv2 as cv
+
+# local modules
+import video
+from video import presets
+import capture
+import display
+import instrument
+from session import SessionReplay
+
+# predicted_point holds the last position once the predictor hasn't been
+# corrected for this long (seconds)
+MAX_PREDICTION_AGE = 0.5
+
+
+class Tracker:
+    # What the main loops rely on, whatever does the actual tracking:
+    #
+    #   read_frame(), get_last_frame(), update(ctx, timestamp), update_all()
+    #   point, track_box, track_window, confidence   (first target)
+    #   points, track_boxes                          (all targets)
+    #   predicted_point(t), add_target(window), ask_for_selection()
+    #   save_model(path), load_model(path)
+    #
+    # Subclasses keep a list of targets with at least point, track_box,
+    # track_window, confidence and predictor attributes, and implement
+    # update, add_target and the model methods.
+    #
+    # camera is anything with a VideoCapture-like read(), by default the
+    # webcam (see get_new_video_source).
+    def __init__(self, camera=None):
+        self.camera = camera if camera is not None else get_new_video_source()
+        self.targets = []
+        # a target whose last update wasn't surer than this counts as lost
+        self.min_confidence = 0.0
+
+        # Selection stuff
+        # idk how this works
+        self.user_selection_box = None
+        self.drag_start = None
+        self.selection_completed = False
+
+    def _first(self, name):
+        return getattr(self.targets[0], name) if self.targets else None
+
+    point = property(lambda self: self._first('point'))
+    track_box = property(lambda self: self._first('track_box'))
+    track_window = property(lambda self: self._first('track_window'))
+    confidence = property(lambda self: self._first('confidence'))
+    predictor = property(lambda self: self._first('predictor'))
+
+    @property
+    def points(self):
+        return [target.point for target in self.targets]
+
+    @property
+    def track_boxes(self):
+        return [target.track_box for target in self.targets]
+
+    def add_target(self, track_window):
+        raise NotImplementedError
+
+    def update(self, ctx=None, timestamp=None):
+        raise NotImplementedError
+
+    def save_model(self, path):
+        raise NotImplementedError
+
+    def load_model(self, path):
+        raise NotImplementedError
+
+    def get_last_frame(self):
+        return self.frame
+
+    def read_frame(self):
+        self.frame = read_frame_from_camera(self.camera)
+
+    def update_all(self):
+        with instrument.span('capture.wait'):
+            self.read_frame()
+        self.update()
+
+    def predicted_point(self, t=None, target=None):
+        # Where the object (default: the first target) will be at time t
+        # (time.monotonic(), default now). A lost target, or one that hasn't
+        # been seen for MAX_PREDICTION_AGE, stays where it was last seen.
+        if target is None:
+            if not self.targets:
+                return None
+            target = self.targets[0]
+        if target.predictor is None or target.confidence <= self.min_confidence:
+            return target.point
+
+        # one call, the track thread may reset the predictor at any time
+        predicted = target.predictor.predict(time.monotonic() if t is None else t, MAX_PREDICTION_AGE)
+        if predicted is None:
+            return target.point
+        x, y = predicted
+        return (int(x), int(y))
+
+    def ask_for_selection(self):
+        # adds one target, call again for more
+        self.selection_completed = False
+        disp = display.default_display()
+        disp.open("selection picker")
+
+        while not self.selection_completed:
+            self.read_frame()
+            disp.show("selection picker", self.frame)
+
+            for event, x, y, flags in disp.mouse_events("selection picker"):
+                self.selector(event, x, y, flags, None)
+
+            ch = disp.key(0.005)
+            if ch == 27:
+                # if the user presses escape,
+                # abort the selection process.
+                break
+
+        disp.close("selection picker")
+
+    def selector(self, event, x, y, flags, param):
+        if not self.selection_completed:
+            if event == cv.EVENT_LBUTTONDOWN:
+                self.drag_start = (x, y)
+
+            if self.drag_start:
+                xmin = min(x, self.drag_start[0])
+                ymin = min(y, self.drag_start[1])
+                xmax = max(x, self.drag_start[0])
+                ymax = max(y, self.drag_start[1])
+                self.user_selection_box = (xmin, ymin, xmax, ymax)
+
+            if event == cv.EVENT_LBUTTONUP:
+                self.drag_start = None
+                track_window = (xmin, ymin, xmax - xmin, ymax - ymin)
+                print("Got selection!")
+                print(track_window)
+
+                self.add_target(track_window)
+                self.selection_completed = True
+
+
+def create_tracker(kind='camshift', **kw):
+    # picks the tracker implementation by name, e.g. from a command line flag
+    if kind == 'camshift':
+        from camshift import CamshiftTracker
+        return CamshiftTracker(**kw)
+    if kind == 'blob':
+        from blob_tracker import BlobTracker
+        return BlobTracker(**kw)
+
+    raise ValueError("Unknown tracker {!r}, use 'camshift' or 'blob'.".format(kind))
+
+
+def get_new_video_source(video_src=0, recorder=None):
+    # Read on a separate thread and always hand out the newest frame. A
+    # replay hands out every frame instead, so runs off the same session
+    # see the same frames.
+    source = video.create_capture(video_src, presets['cube'])
+    policy = capture.BLOCK if isinstance(source, SessionReplay) else capture.LATEST
+    camera = capture.ThreadedCapture(source, policy=policy, recorder=recorder)
+
+    return camera
+
+
+def read_frame_from_camera(camera):
+    # Reads frame from camera, and flips it.
+    ret_value, frame = camera.read()
+    frame = cv.flip(frame, 1)
+
+    assert ret_value, "Something went horribly wrong, unable to read frame from camera!"
+
+    return frame
@@ -24,7 +24,7 @@ class TestSceneRender():
         if bgImg is not None:
             self.sceneBg = bgImg.copy()
         else:
-            self.sceneBg = np.zeros(defaultSize, defaultSize, np.uint8)
+            self.sceneBg = np.zeros((defaultSize, defaultSize, 3), np.uint8)
 
         self.w = self.sceneBg.shape[0]
         self.h = self.sceneBg.shape[1]
@@ -40,6 +40,11 @@ class TestSceneRender():
          (self.h/2 + self.h/10, self.w/2 + self.w/10), (self.h/2 + self.h/10, self.w/2)]).astype(int)
         self.currentRect = self.initialRect
 
+        # getNextFrame() without a dst draws here, and only puts the
+        # background back where the last frame drew
+        self.frame = None
+        self.dirty = None
+
     def getXOffset(self, time):
         return int( self.xAmpl*cos(time*self.speed))
 
@@ -76,18 +81,34 @@ class TestSceneRender():
             x1, y1 = self.currentRect[2]
             return np.array([x0, y0, x1, y1])
 
-    def getNextFrame(self):
-        img = self.sceneBg.copy()
+    def getNextFrame(self, dst=None):
+        # Draws into dst if given. Otherwise into a buffer that's reused on
+        # the next call, so don't hold on to (or draw on) the result.
+        if dst is None:
+            if self.frame is None:
+                self.frame = self.sceneBg.copy()
+            elif self.dirty is not None:
+                r0, c0, r1, c1 = self.dirty
+                self.frame[r0:r1, c0:c1] = self.sceneBg[r0:r1, c0:c1]
+            img = self.frame
+        else:
+            np.copyto(dst, self.sceneBg)
+            img = dst
 
         if self.foreground is not None:
             self.currentCenter = (self.center[0] + self.getXOffset(self.time), self.center[1] + self.getYOffset(self.time))
-            img[self.currentCenter[0]:self.currentCenter[0]+self.foreground.shape[0],
-             self.currentCenter[1]:self.currentCenter[1]+self.foreground.shape[1]] = self.foreground
+            r0, c0 = self.currentCenter
+            r1, c1 = r0 + self.foreground.shape[0], c0 + self.foreground.shape[1]
+            img[r0:r1, c0:c1] = self.foreground
         else:
-            self.currentRect = self.initialRect + np.int( 30*cos(self.time*self.speed) + 50*sin(self.time*self.speed))
+            self.currentRect = self.initialRect + int( 30*cos(self.time*self.speed) + 50*sin(self.time*self.speed))
             if self.deformation:
-                self.currentRect[1:3] += self.h/20*cos(self.time)
+                self.currentRect[1:3] += int(self.h/20*cos(self.time))
             cv.fillConvexPoly(img, self.currentRect, (0, 0, 255))
+            (c0, r0), (c1, r1) = self.currentRect.min(0), self.currentRect.max(0) + 1
+
+        if img is self.frame:
+            self.dirty = (max(r0, 0), max(c0, 0), r1, c1)
 
         self.time += self.timeStep
         return img
@@ -18,10 +18,13 @@ Usage:
      - integer number for camera capture
      - name of video file
      - synth:<params> for procedural video
+     - replay:<session path>[:realtime=0][:loop=1] for a session recorded
+       with session.py, at the recorded pace unless realtime=0
 
 Synth examples:
     synth:bg=../data/lena.jpg:noise=0.1
     synth:class=chess:bg=../data/lena.jpg:noise=0.1:size=640x480
+    synth:class=greenscreen:blobs=2:path=bounce:noise=0.02:size=1280x720
 
 Keys:
     ESC    - exit
@@ -45,7 +48,7 @@ from tst_scene_render import TestSceneRender
 import common
 
 class VideoSynthBase(object):
-    def __init__(self, size=None, noise=0.0, bg = None, **params):
+    def __init__(self, size=None, noise=0.0, bg = None, noise_frames=4, **params):
         self.bg = None
         self.frame_size = (640, 480)
         if bg is not None:
@@ -56,28 +59,51 @@ class VideoSynthBase(object):
         if size is not None:
             w, h = map(int, size.split('x'))
             self.frame_size = (w, h)
-            self.bg = cv.resize(self.bg, self.frame_size)
+            if self.bg is not None:
+                self.bg = cv.resize(self.bg, self.frame_size)
 
         self.noise = float(noise)
+        # a few noise frames made up front and cycled through, generating
+        # fresh noise every frame costs more than the rest of the rendering
+        self.noise_frames = int(noise_frames)
+        self._noise_bank = None
+        self._noise_index = 0
 
     def render(self, dst):
         pass
 
+    def add_noise(self, buf):
+        # in place, buf is an 8UC3 frame of the source's size
+        if self.noise <= 0.0:
+            return
+
+        if self._noise_bank is None or self._noise_bank[0].shape != buf.shape:
+            self._noise_bank = []
+            for _ in range(self.noise_frames):
+                noise = np.zeros(buf.shape, np.int8)
+                cv.randn(noise, np.zeros(3), np.ones(3)*255*self.noise)
+                self._noise_bank.append(noise)
+
+        noise = self._noise_bank[self._noise_index % len(self._noise_bank)]
+        self._noise_index += 1
+        cv.add(buf, noise, buf, dtype=cv.CV_8UC3)
+
     def read(self, dst=None):
+        # Renders into dst if given (no allocations at all), otherwise into
+        # a new frame, like VideoCapture.read.
         w, h = self.frame_size
 
+        if dst is None:
+            dst = np.empty((h, w, 3), np.uint8)
         if self.bg is None:
-            buf = np.zeros((h, w, 3), np.uint8)
+            dst[:] = 0
         else:
-            buf = self.bg.copy()
+            np.copyto(dst, self.bg)
 
-        self.render(buf)
+        self.render(dst)
+        self.add_noise(dst)
 
-        if self.noise > 0.0:
-            noise = np.zeros((h, w, 3), np.int8)
-            cv.randn(noise, np.zeros(3), np.ones(3)*255*self.noise)
-            buf = cv.add(buf, noise, dtype=cv.CV_8UC3)
-        return True, buf
+        return True, dst
 
     def isOpened(self):
         return True
@@ -90,10 +116,11 @@ class Book(VideoSynthBase):
         self.render = TestSceneRender(backGr, fgr, speed = 1)
 
     def read(self, dst=None):
-        noise = np.zeros(self.render.sceneBg.shape, np.int8)
-        cv.randn(noise, np.zeros(3), np.ones(3)*255*self.noise)
+        if dst is None:
+            dst = np.empty_like(self.render.sceneBg)
+        self.add_noise(self.render.getNextFrame(dst))
 
-        return True, cv.add(self.render.getNextFrame(), noise, dtype=cv.CV_8UC3)
+        return True, dst
 
 class Cube(VideoSynthBase):
     def __init__(self, **kw):
@@ -101,10 +128,11 @@ class Cube(VideoSynthBase):
         self.render = TestSceneRender(cv.imread('../data/pca_test1.jpg'), deformation = True,  speed = 1)
 
     def read(self, dst=None):
-        noise = np.zeros(self.render.sceneBg.shape, np.int8)
-        cv.randn(noise, np.zeros(3), np.ones(3)*255*self.noise)
+        if dst is None:
+            dst = np.empty_like(self.render.sceneBg)
+        self.add_noise(self.render.getNextFrame(dst))
 
-        return True, cv.add(self.render.getNextFrame(), noise, dtype=cv.CV_8UC3)
+        return True, dst
 
 class Chess(VideoSynthBase):
     def __init__(self, **kw):
@@ -154,14 +182,95 @@ class Chess(VideoSynthBase):
         self.draw_quads(dst, self.black_quads, (10, 10, 10))
 
 
-classes = dict(chess=Chess, book=Book, cube=Cube)
+class GreenScreen(VideoSynthBase):
+    '''
+    White blobs (lab coats) moving over an unevenly lit green screen, with
+    the true positions known, for benchmarking the keyer and the trackers.
+
+    Params on top of size and noise:
+        blobs=<n>           number of blobs (1)
+        fps=<rate>          frames per second of the motion (30)
+        path=<trajectory>   lissajous, circle, bounce or still (lissajous)
+        speed=<factor>      speeds the motion up or down (1)
+        color=<b>,<g>,<r>   colour of the blobs (235,235,240)
+        seed=<n>            for the starting phases (0)
+
+    After read(), `positions` holds the centre of every blob in that frame.
+    positions_at(n) gives them for any frame number.
+    '''
+    def __init__(self, blobs=1, fps=30, path='lissajous', speed=1, color='235,235,240', seed=0, **kw):
+        super(GreenScreen, self).__init__(**kw)
+        w, h = self.frame_size
+
+        if self.bg is None:
+            # brighter towards one corner, like a real screen under lights
+            shade = np.linspace(0.6, 1.0, w, dtype=np.float32)[np.newaxis, :] * \
+                    np.linspace(0.7, 1.0, h, dtype=np.float32)[:, np.newaxis]
+            self.bg = np.zeros((h, w, 3), np.uint8)
+            self.bg[..., 0] = 40 * shade
+            self.bg[..., 1] = 170 * shade
+            self.bg[..., 2] = 50 * shade
+
+        if path not in ('lissajous', 'circle', 'bounce', 'still'):
+            raise ValueError('unknown path {!r}'.format(path))
+        self.path = path
+        self.fps = float(fps)
+        self.speed = float(speed)
+        self.color = tuple(int(c) for c in color.split(','))
+        self.blob_size = (w // 8, h // 3)
+
+        rng = np.random.default_rng(int(seed))
+        self.phases = rng.uniform(0, 2 * pi, (int(blobs), 2))
+
+        self.frame_index = 0
+        self.positions = []
+
+    def positions_at(self, n):
+        w, h = self.frame_size
+        bw, bh = self.blob_size
+        # range the centres can move in without leaving the frame
+        rx, ry = (w - bw) / 2, (h - bh) / 2
+        t = n / self.fps * self.speed
+
+        positions = []
+        for px, py in self.phases:
+            if self.path == 'lissajous':
+                x, y = np.sin(1.3 * t + px), np.sin(2.1 * t + py)
+            elif self.path == 'circle':
+                x, y = np.cos(t + px), np.sin(t + px)
+            elif self.path == 'bounce':
+                # triangle waves, i.e. bouncing off the edges
+                x = 2 * abs((0.4 * t + px / pi) % 2 - 1) - 1
+                y = 2 * abs((0.3 * t + py / pi) % 2 - 1) - 1
+            else:
+                x, y = np.sin(px), np.sin(py)
+            positions.append((float(w / 2 + rx * x), float(h / 2 + ry * y)))
+
+        return positions
+
+    def render(self, dst):
+        self.positions = self.positions_at(self.frame_index)
+        self.frame_index += 1
+
+        for cx, cy in self.positions:
+            cv.ellipse(dst, ((cx, cy), self.blob_size, 0), self.color, -1, cv.LINE_AA)
+
+    def get(self, prop):
+        # the bits of VideoCapture.get that make sense here
+        w, h = self.frame_size
+        return {cv.CAP_PROP_FPS: self.fps, cv.CAP_PROP_FRAME_WIDTH: w,
+                cv.CAP_PROP_FRAME_HEIGHT: h}.get(prop, 0.0)
+
+
+classes = dict(chess=Chess, book=Book, cube=Cube, greenscreen=GreenScreen)
 
 presets = dict(
     empty = 'synth:',
     lena = 'synth:bg=../data/lena.jpg:noise=0.1',
     chess = 'synth:class=chess:bg=../data/lena.jpg:noise=0.1:size=640x480',
     book = 'synth:class=book:bg=../data/graf1.png:noise=0.1:size=640x480',
-    cube = 'synth:class=cube:bg=../data/pca_test1.jpg:noise=0.0:size=640x480'
+    cube = 'synth:class=cube:bg=../data/pca_test1.jpg:noise=0.0:size=640x480',
+    greenscreen = 'synth:class=greenscreen:noise=0.02:size=640x480'
 )
 
 
@@ -178,10 +287,17 @@ def create_capture(source = 0, fallback = presets['chess']):
     source = chunks[0]
     try: source = int(source)
     except ValueError: pass
+    if source == 'replay':
+        # the session path comes before the params
+        path, chunks = chunks[1], chunks[1:]
     params = dict( s.split('=') for s in chunks[1:] )
 
     cap = None
-    if source == 'synth':
+    if source == 'replay':
+        from session import SessionReplay
+        try: cap = SessionReplay(path, realtime=params.get('realtime', '1') != '0', loop=params.get('loop', '0') != '0')
+        except (IOError, ValueError) as e: print(e)
+    elif source == 'synth':
         Class = classes.get(params.get('class', None), VideoSynthBase)
         try: cap = Class(**params)
         except: pass
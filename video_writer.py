@@ -0,0 +1,217 @@
+import os
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+
+import numpy as np
+import cv2 as cv
+
+# local modules
+from audio import SAMPLE_RATE
+from capture import BLOCK, DROP_OLDEST
+
+# what write() does when the encoder can't keep up (BLOCK and DROP_OLDEST
+# as in capture.py)
+DROP_NEWEST = 'drop_newest'   # the frame being written is dropped
+
+# used to put the audio track into the video, see AsyncVideoWriter.close
+FFMPEG_COMMAND = ['ffmpeg', '-y', '-loglevel', 'error']
+
+
+class AudioTrack:
+    # Audio engine sink (hook it up with audio.TeeSink) that saves what was
+    # played to a WAV, along with the time (time.monotonic) of the first
+    # sample. If the engine stalls, the gap is filled with silence so the
+    # track stays in step with the clock, like the speaker did.
+    def __init__(self, path, sample_rate=SAMPLE_RATE, tolerance=0.05):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.tolerance = tolerance
+
+        self.start = None
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._wav_file = wave.open(path, 'wb')
+        self._wav_file.setnchannels(1)
+        self._wav_file.setsampwidth(2)
+        self._wav_file.setframerate(sample_rate)
+
+    def write(self, pcm):
+        with self._lock:
+            if self._wav_file is None:
+                return
+
+            now = time.monotonic()
+            if self.start is None:
+                self.start = now
+
+            behind = now - (self.start + self.samples / self.sample_rate)
+            if behind > self.tolerance:
+                gap = int(behind * self.sample_rate)
+                self._wav_file.writeframes(np.zeros(gap, np.int16).tobytes())
+                self.samples += gap
+
+            self._wav_file.writeframes(pcm.tobytes())
+            self.samples += len(pcm)
+
+    def close(self):
+        with self._lock:
+            if self._wav_file is not None:
+                self._wav_file.close()
+                self._wav_file = None
+
+
+class AsyncVideoWriter:
+    # Saves frames to a video file without encoding on the caller's thread.
+    # write() copies the frame into one of `slots` preallocated buffers and
+    # returns, a worker thread encodes them with cv2.VideoWriter. When all
+    # buffers are waiting to be encoded, `policy` decides what gives.
+    #
+    # Frames are placed by their timestamp at a constant fps: frames that
+    # come too late for their spot are skipped, and gaps (dropped frames,
+    # a stalled loop) are filled by repeating the next frame. That keeps
+    # the video in step with the audio track (audio=True, see AudioTrack),
+    # which close() muxes in with ffmpeg. Without ffmpeg the video and the
+    # WAV are left next to each other.
+    def __init__(self, path, fps=30.0, fourcc='mp4v', slots=8, policy=DROP_NEWEST, audio=False):
+        assert slots >= 2, "AsyncVideoWriter needs at least 2 slots (one is always being encoded)."
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.policy = policy
+        self.n_slots = slots
+
+        base, ext = os.path.splitext(path)
+        self.video_path = base + '.video' + ext if audio else path
+        self.audio = AudioTrack(base + '.wav') if audio else None
+
+        self.slots = None
+        self.timestamps = [0.0] * slots
+        self._pending = deque()
+        self._free = deque(range(slots))
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.start = None
+        self._next_index = 0
+        self._writer = None
+
+        # counters
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.repeated = 0
+        self.max_depth = 0
+
+        self._thread = threading.Thread(target=self._run, name='video-writer', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        with self._cond:
+            return dict(queued=self.queued, written=self.written, dropped=self.dropped,
+                        skipped=self.skipped, repeated=self.repeated,
+                        depth=len(self._pending), max_depth=self.max_depth)
+
+    def write(self, frame, timestamp=None):
+        # timestamp is the capture time (time.monotonic) of the frame,
+        # default now. Returns False if the frame was dropped.
+        timestamp = time.monotonic() if timestamp is None else timestamp
+
+        with self._cond:
+            if self._closed:
+                return False
+            if self.slots is None:
+                self.slots = [np.empty_like(frame) for _ in range(self.n_slots)]
+
+            if not self._free:
+                if self.policy == BLOCK:
+                    self._cond.wait_for(lambda: self._free)
+                elif self.policy == DROP_OLDEST:
+                    self.dropped += 1
+                    self._free.append(self._pending.popleft())
+                else:
+                    self.dropped += 1
+                    return False
+
+            idx = self._free.popleft()
+
+        # the copy happens outside the lock, the slot isn't anyone else's
+        np.copyto(self.slots[idx], frame)
+
+        with self._cond:
+            self.timestamps[idx] = timestamp
+            self._pending.append(idx)
+            self.queued += 1
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._cond.notify_all()
+
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                # out of _pending, so DROP_OLDEST can't take it back
+                idx = self._pending.popleft()
+
+            self._encode(self.slots[idx], self.timestamps[idx])
+
+            with self._cond:
+                self._free.append(idx)
+                self._cond.notify_all()
+
+    def _encode(self, frame, timestamp):
+        if self._writer is None:
+            h, w = frame.shape[:2]
+            self._writer = cv.VideoWriter(self.video_path, cv.VideoWriter_fourcc(*self.fourcc), self.fps, (w, h))
+            self.start = timestamp
+
+        index = int(round((timestamp - self.start) * self.fps))
+        if index < self._next_index:
+            self.skipped += 1
+            return
+
+        copies = index - self._next_index + 1
+        for _ in range(copies):
+            self._writer.write(frame)
+        self._next_index = index + 1
+        self.written += 1
+        self.repeated += copies - 1
+
+    def close(self):
+        # encodes whatever is still queued, then muxes in the audio
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+        if self._writer is not None:
+            self._writer.release()
+        if self.audio is not None:
+            self.audio.close()
+            self._mux()
+
+    def _mux(self):
+        if self._writer is None or self.audio.start is None:
+            return
+
+        # line the audio up with the first video frame
+        offset = self.audio.start - self.start
+        audio_input = ['-itsoffset', str(offset)] if offset > 0 else ['-ss', str(-offset)]
+        command = FFMPEG_COMMAND + ['-i', self.video_path] + audio_input + ['-i', self.audio.path,
+                                   '-map', '0:v', '-map', '1:a', '-c:v', 'copy', '-c:a', 'aac', self.path]
+        try:
+            subprocess.run(command, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print("Couldn't add the audio to {} ({}), it's in {}".format(self.video_path, e, self.audio.path))
+            return
+
+        os.remove(self.video_path)
+        os.remove(self.audio.path)